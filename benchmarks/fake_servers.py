@@ -0,0 +1,633 @@
+"""
+Local stand-ins for the GitHub REST API and the Trello API.
+
+Only the endpoints trolley calls are implemented. Every response carries
+the same rate-limit headers the real services send, and the server can
+add latency, change page sizes, and enforce a rate limit so benchmarks
+exercise the same code paths a real run does.
+
+"""
+
+import datetime
+import itertools
+import json
+import re
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, unquote, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import parse_qs, urlparse
+
+
+def now():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def split_ids(ids):
+    # Trello takes id lists as a comma separated string or a JSON array
+    if isinstance(ids, list):
+        return ids
+    return [id for id in (ids or '').split(',') if id]
+
+
+def user_json(base_url):
+    return {
+        'login': 'bench',
+        'id': 1,
+        'avatar_url': '',
+        'gravatar_id': '',
+        'url': base_url + '/users/bench',
+        'html_url': 'https://github.com/bench',
+        'followers_url': base_url + '/users/bench/followers',
+        'following_url': base_url + '/users/bench/following{/other_user}',
+        'gists_url': base_url + '/users/bench/gists{/gist_id}',
+        'starred_url': base_url + '/users/bench/starred{/owner}{/repo}',
+        'subscriptions_url': base_url + '/users/bench/subscriptions',
+        'organizations_url': base_url + '/users/bench/orgs',
+        'repos_url': base_url + '/users/bench/repos',
+        'events_url': base_url + '/users/bench/events{/privacy}',
+        'received_events_url': base_url + '/users/bench/received_events',
+        'type': 'User',
+        'site_admin': False,
+    }
+
+
+class FakeState(object):
+    """The data both fake services serve, plus request counters."""
+
+    def __init__(self, base_url='http://127.0.0.1', issues=0, labels=0,
+                 milestones=0, cards=0, lists=('Uncategorized',)):
+        self.base_url = base_url
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.requests = {'github': 0, 'trello': 0}
+        self.bytes_sent = 0
+
+        self.issues = {}
+        self.labels = {}
+        self.milestones = {}
+        for index in range(issues):
+            self.create_issue('Issue {}'.format(index), 'Body {}'.format(index))
+        for index in range(labels):
+            self.create_label('Label {}'.format(index), 'ededed')
+        for index in range(milestones):
+            self.create_milestone('Milestone {}'.format(index))
+
+        self.board_id = 'b0a7d0000000000000000000'
+        self.lists = {}
+        self.cards = {}
+        self.trello_labels = {}
+        for name in lists:
+            self.create_list(name)
+        first_list = sorted(self.lists)[0] if self.lists else None
+        for index in range(cards):
+            self.create_card(first_list, 'Card {}'.format(index),
+                             'Description {}'.format(index))
+
+    def next_id(self):
+        return next(self.ids)
+
+    # github
+
+    def repo_url(self):
+        return self.base_url + '/repos/bench/repo'
+
+    def repository_json(self):
+        url = self.repo_url()
+        templates = [
+            'archive_url', 'assignees_url', 'blobs_url', 'branches_url',
+            'collaborators_url', 'comments_url', 'commits_url',
+            'compare_url', 'contents_url', 'contributors_url',
+            'deployments_url', 'downloads_url', 'events_url', 'forks_url',
+            'git_commits_url', 'git_refs_url', 'git_tags_url',
+            'hooks_url', 'issue_comment_url', 'issue_events_url',
+            'issues_url', 'keys_url', 'labels_url', 'languages_url',
+            'merges_url', 'milestones_url', 'notifications_url',
+            'pulls_url', 'releases_url', 'stargazers_url', 'statuses_url',
+            'subscribers_url', 'subscription_url', 'tags_url', 'teams_url',
+            'trees_url',
+        ]
+        data = dict((name, '{}/{}'.format(url, name[:-4])) for name in templates)
+        data.update({
+            'id': 1,
+            'name': 'repo',
+            'full_name': 'bench/repo',
+            'owner': user_json(self.base_url),
+            'private': False,
+            'fork': False,
+            'description': 'benchmark repository',
+            'url': url,
+            'html_url': 'https://github.com/bench/repo',
+            'clone_url': 'https://github.com/bench/repo.git',
+            'git_url': 'git://github.com/bench/repo.git',
+            'ssh_url': 'git@github.com:bench/repo.git',
+            'svn_url': 'https://github.com/bench/repo',
+            'mirror_url': None,
+            'homepage': None,
+            'language': None,
+            'forks': 0,
+            'forks_count': 0,
+            'stargazers_count': 0,
+            'watchers': 0,
+            'watchers_count': 0,
+            'size': 0,
+            'default_branch': 'master',
+            'master_branch': 'master',
+            'open_issues': len(self.issues),
+            'open_issues_count': len(self.issues),
+            'has_issues': True,
+            'has_wiki': False,
+            'has_pages': False,
+            'has_projects': False,
+            'has_downloads': False,
+            'archived': False,
+            'network_count': 0,
+            'subscribers_count': 0,
+            'pushed_at': now(),
+            'created_at': now(),
+            'updated_at': now(),
+            'permissions': {'admin': True, 'push': True, 'pull': True},
+        })
+        return data
+
+    def issue_json(self, issue):
+        url = '{}/issues/{}'.format(self.repo_url(), issue['number'])
+        return {
+            'id': issue['number'],
+            'number': issue['number'],
+            'url': url,
+            'html_url': 'https://github.com/bench/repo/issues/{}'.format(issue['number']),
+            'labels_url': url + '/labels{/name}',
+            'comments_url': url + '/comments',
+            'events_url': url + '/events',
+            'repository_url': self.repo_url(),
+            'title': issue['title'],
+            'body': issue['body'],
+            'body_html': '',
+            'body_text': issue['body'],
+            'state': issue['state'],
+            'locked': False,
+            'user': user_json(self.base_url),
+            'labels': [self.label_json(self.labels[name])
+                       for name in issue['labels'] if name in self.labels],
+            'assignee': None,
+            'assignees': [],
+            'milestone': None,
+            'comments': 0,
+            'closed_at': None,
+            'closed_by': None,
+            'created_at': issue['created_at'],
+            'updated_at': issue['updated_at'],
+        }
+
+    def label_json(self, label):
+        return {
+            'url': '{}/labels/{}'.format(self.repo_url(), label['name']),
+            'name': label['name'],
+            'color': label['color'],
+            'description': None,
+        }
+
+    def milestone_json(self, milestone):
+        url = '{}/milestones/{}'.format(self.repo_url(), milestone['number'])
+        return {
+            'id': milestone['number'],
+            'number': milestone['number'],
+            'url': url,
+            'html_url': 'https://github.com/bench/repo/milestones/{}'.format(
+                milestone['number']),
+            'labels_url': url + '/labels',
+            'title': milestone['title'],
+            'description': '',
+            'state': 'open',
+            'creator': user_json(self.base_url),
+            'open_issues': 0,
+            'closed_issues': 0,
+            'created_at': now(),
+            'updated_at': now(),
+            'due_on': None,
+        }
+
+    def create_issue(self, title, body, labels=()):
+        number = self.next_id()
+        self.issues[number] = {
+            'number': number,
+            'title': title,
+            'body': body,
+            'labels': list(labels),
+            'state': 'open',
+            'created_at': now(),
+            'updated_at': now(),
+        }
+        return self.issues[number]
+
+    def create_label(self, name, color):
+        self.labels[name] = {'name': name, 'color': color}
+        return self.labels[name]
+
+    def create_milestone(self, title):
+        number = self.next_id()
+        self.milestones[number] = {'number': number, 'title': title}
+        return self.milestones[number]
+
+    # trello
+
+    def trello_id(self):
+        return '{:024x}'.format(self.next_id())
+
+    def board_json(self):
+        return {
+            'id': self.board_id,
+            'name': 'Benchmark',
+            'desc': '',
+            'closed': False,
+            'url': 'https://trello.com/b/bench',
+            'idOrganization': None,
+            'pinned': False,
+            'prefs': {},
+            'labelNames': {},
+            'dateLastActivity': now(),
+        }
+
+    def list_json(self, item):
+        return {
+            'id': item['id'],
+            'name': item['name'],
+            'closed': False,
+            'pos': item['pos'],
+            'idBoard': self.board_id,
+            'subscribed': False,
+        }
+
+    def card_json(self, card):
+        return {
+            'id': card['id'],
+            'name': card['name'],
+            'desc': card['desc'],
+            'closed': card['closed'],
+            'idBoard': self.board_id,
+            'idList': card['idList'],
+            'idLabels': list(card['idLabels']),
+            'labels': [self.trello_labels[label_id] for label_id in card['idLabels']
+                       if label_id in self.trello_labels],
+            'idMembers': [],
+            'idShort': card['idShort'],
+            'pos': card['idShort'],
+            'url': 'https://trello.com/c/{}'.format(card['id']),
+            'shortUrl': 'https://trello.com/c/{}'.format(card['id']),
+            'shortLink': card['id'][:8],
+            'due': None,
+            'dueComplete': False,
+            'dateLastActivity': card['dateLastActivity'],
+            'badges': {'comments': 0, 'attachments': 0, 'checkItems': 0,
+                       'checkItemsChecked': 0, 'votes': 0},
+            'checkItemStates': [],
+            'customFieldItems': [],
+            'idChecklists': [],
+            'idAttachmentCover': None,
+            'start': None,
+            'subscribed': False,
+        }
+
+    def create_list(self, name):
+        list_id = self.trello_id()
+        self.lists[list_id] = {'id': list_id, 'name': name, 'pos': len(self.lists)}
+        return self.lists[list_id]
+
+    def create_card(self, list_id, name, desc, label_ids=()):
+        card_id = self.trello_id()
+        self.cards[card_id] = {
+            'id': card_id,
+            'idShort': len(self.cards) + 1,
+            'idList': list_id,
+            'name': name,
+            'desc': desc,
+            'closed': False,
+            'idLabels': list(label_ids),
+            'dateLastActivity': now(),
+        }
+        return self.cards[card_id]
+
+    def create_trello_label(self, name, color=None):
+        label_id = self.trello_id()
+        self.trello_labels[label_id] = {'id': label_id, 'idBoard': self.board_id,
+                                        'name': name, 'color': color}
+        return self.trello_labels[label_id]
+
+
+class RateLimit(object):
+    """Fixed-window limit like the ones the real services enforce."""
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.window = time.time()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.time()
+            if now - self.window >= self.period:
+                self.window = now
+                self.used = 0
+            self.used += 1
+            return self.used <= self.limit
+
+    def remaining(self):
+        return max(self.limit - self.used, 0)
+
+    def reset(self):
+        return self.window + self.period
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # plumbing
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        raw = self.rfile.read(length).decode('utf-8')
+        if 'json' in (self.headers.get('Content-Type') or '') or raw.startswith('{'):
+            return json.loads(raw)
+        return dict((key, values[-1]) for key, values in parse_qs(raw).items())
+
+    def dispatch(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        service = 'trello' if url.path.startswith('/1/') else 'github'
+        body = self.read_body()
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        limit = server.rate_limits[service]
+        with server.state.lock:
+            server.state.requests[service] += 1
+
+        if not limit.take():
+            if service == 'github':
+                self.respond(403, {'message': 'API rate limit exceeded'}, limit)
+            else:
+                self.respond(429, {'message': 'rate limit exceeded'}, limit)
+            return
+
+        with server.state.lock:
+            if service == 'github':
+                status, data, headers = self.github(method, url.path, query, body)
+            else:
+                status, data, headers = self.trello(method, url.path[2:], query, body)
+        self.respond(status, data, limit, headers)
+
+    def respond(self, status, data, limit, headers=None):
+        payload = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('X-RateLimit-Limit', str(limit.limit))
+        self.send_header('X-RateLimit-Remaining', str(limit.remaining()))
+        self.send_header('X-RateLimit-Reset', str(int(limit.reset())))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        with self.server.state.lock:
+            self.server.state.bytes_sent += len(payload)
+
+    def paginate(self, items, query):
+        per_page = min(int(query.get('per_page', self.server.page_size)), 100)
+        page = int(query.get('page', 1))
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(items):
+            base = 'http://{}:{}{}'.format(
+                self.server.server_address[0], self.server.server_address[1],
+                urlparse(self.path).path)
+
+            def link(page, rel):
+                params = dict(query, page=str(page), per_page=str(per_page))
+                return '<{}?{}>; rel="{}"'.format(
+                    base, '&'.join('{}={}'.format(k, v) for k, v in sorted(params.items())),
+                    rel)
+
+            last = (len(items) + per_page - 1) // per_page
+            headers['Link'] = ', '.join([link(page + 1, 'next'), link(last, 'last')])
+        return items[start:start + per_page], headers
+
+    # github
+
+    def github(self, method, path, query, body):
+        state = self.server.state
+        repo = '/repos/bench/repo'
+
+        if path in (repo, repo + '/'):
+            return 200, state.repository_json(), {}
+
+        if path == '/rate_limit':
+            return 200, {'resources': {}, 'rate': {}}, {}
+
+        if path == repo + '/issues':
+            if method == 'POST':
+                issue = state.create_issue(body['title'], body.get('body') or '',
+                                           body.get('labels') or [])
+                return 201, state.issue_json(issue), {}
+            wanted = query.get('state', 'open')
+            since = query.get('since')
+            issues = [issue for number, issue in sorted(state.issues.items(), reverse=True)
+                      if wanted in ('all', issue['state']) and
+                      (not since or issue['updated_at'] >= since)]
+            page, headers = self.paginate(issues, query)
+            return 200, [state.issue_json(issue) for issue in page], headers
+
+        match = re.match(repo + r'/issues/(\d+)$', path)
+        if match:
+            issue = state.issues.get(int(match.group(1)))
+            if issue is None:
+                return 404, {'message': 'Not Found'}, {}
+            if method == 'PATCH':
+                for key in ('title', 'body', 'state'):
+                    if key in body:
+                        issue[key] = body[key]
+                if 'labels' in body:
+                    issue['labels'] = body['labels']
+                issue['updated_at'] = now()
+            return 200, state.issue_json(issue), {}
+
+        if path == repo + '/labels':
+            if method == 'POST':
+                label = state.create_label(body['name'], body.get('color', 'ededed'))
+                return 201, state.label_json(label), {}
+            labels = sorted(state.labels.values(), key=lambda label: label['name'])
+            page, headers = self.paginate(labels, query)
+            return 200, [state.label_json(label) for label in page], headers
+
+        match = re.match(repo + r'/labels/(.+)$', path)
+        if match:
+            name = unquote(match.group(1))
+            if method == 'DELETE':
+                if state.labels.pop(name, None) is None:
+                    return 404, {'message': 'Not Found'}, {}
+                return 204, None, {}
+            return 200, state.label_json(state.labels[name]), {}
+
+        if path == repo + '/milestones':
+            if method == 'POST':
+                milestone = state.create_milestone(body['title'])
+                return 201, state.milestone_json(milestone), {}
+            milestones = sorted(state.milestones.values(),
+                                key=lambda milestone: milestone['number'])
+            page, headers = self.paginate(milestones, query)
+            return 200, [state.milestone_json(milestone) for milestone in page], headers
+
+        match = re.match(repo + r'/milestones/(\d+)$', path)
+        if match and method == 'DELETE':
+            if state.milestones.pop(int(match.group(1)), None) is None:
+                return 404, {'message': 'Not Found'}, {}
+            return 204, None, {}
+
+        return 404, {'message': 'Not Found'}, {}
+
+    # trello
+
+    def trello(self, method, path, query, body):
+        if path.startswith('/batch'):
+            responses = []
+            for url in query.get('urls', '').split(','):
+                parsed = urlparse(url)
+                params = dict((key, values[-1]) for key, values in parse_qs(parsed.query).items())
+                status, data, _ = self.trello('GET', parsed.path, params, {})
+                responses.append({str(status): data})
+            return 200, responses, {}
+
+        state = self.server.state
+        board = '/boards/' + state.board_id
+        path = path.rstrip('/')
+        params = dict(query, **body)
+
+        if path == board:
+            return 200, state.board_json(), {}
+
+        if path.startswith(board + '/cards'):
+            wanted = params.get('filter', path[len(board + '/cards/'):] or 'open')
+            cards = [card for card in state.cards.values()
+                     if wanted == 'all' or not card['closed']]
+            return 200, [state.card_json(card) for card in cards], {}
+
+        if path == board + '/lists':
+            return 200, [state.list_json(item) for item in state.lists.values()], {}
+
+        if path == board + '/labels':
+            return 200, list(state.trello_labels.values()), {}
+
+        if path in ('/lists', board + '/lists') and method == 'POST':
+            return 200, state.list_json(state.create_list(params['name'])), {}
+
+        match = re.match(r'/lists/(\w+)$', path)
+        if match and match.group(1) in state.lists:
+            return 200, state.list_json(state.lists[match.group(1)]), {}
+
+        match = re.match(r'/lists/(\w+)/cards$', path)
+        if match and method == 'POST':
+            card = state.create_card(match.group(1), params['name'], params.get('desc', ''))
+            return 200, state.card_json(card), {}
+        if match and method == 'GET':
+            wanted = params.get('filter', 'open')
+            cards = [card for card in state.cards.values()
+                     if card['idList'] == match.group(1) and
+                     (wanted == 'all' or card['closed'] == (wanted == 'closed'))]
+            return 200, [state.card_json(card) for card in cards], {}
+
+        if path == '/cards' and method == 'POST':
+            card = state.create_card(params['idList'], params['name'], params.get('desc', ''),
+                                     split_ids(params.get('idLabels')))
+            return 200, state.card_json(card), {}
+
+        if path == '/labels' and method == 'POST':
+            label = state.create_trello_label(params['name'], params.get('color'))
+            return 200, label, {}
+
+        match = re.match(r'/cards/(\w+)(?:/(\w+))?$', path)
+        if match and match.group(1) in state.cards:
+            card = state.cards[match.group(1)]
+            if method == 'PUT':
+                field = match.group(2)
+                if field:
+                    params = {field: params.get('value', '')}
+                for key in ('name', 'desc', 'closed', 'idList'):
+                    if key in params:
+                        card[key] = params[key]
+                if 'idLabels' in params:
+                    card['idLabels'] = split_ids(params['idLabels'])
+                card['dateLastActivity'] = now()
+            return 200, state.card_json(card), {}
+
+        return 404, {'message': 'Not Found'}, {}
+
+
+class FakeAPIServer(ThreadingMixIn, HTTPServer):
+    """Serve fake GitHub and Trello APIs from one local port.
+
+    GitHub paths are served at the root and Trello paths under ``/1/``, so
+    both GITHUB_BASE_URL and TRELLO_BASE_URL can point at ``url``.
+    """
+
+    daemon_threads = True
+    # the async engine opens many connections at once
+    request_queue_size = 128
+
+    def __init__(self, state, latency=0.0, page_size=30, rate_limits=None,
+                 address=('127.0.0.1', 0)):
+        HTTPServer.__init__(self, address, FakeAPIHandler)
+        self.state = state
+        self.state.base_url = self.url
+        self.latency = latency
+        self.page_size = page_size
+        limits = {'github': (5000, 3600), 'trello': (100, 10)}
+        limits.update(rate_limits or {})
+        self.rate_limits = dict((service, RateLimit(*limit))
+                                for service, limit in limits.items())
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
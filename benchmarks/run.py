@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Benchmark trolley's commands against local fake GitHub and Trello APIs.
+
+Each scenario and size runs in a fresh process so peak memory is measured
+per run. Results are printed as a table, or as JSON with ``--json``.
+
+    $ python benchmarks/run.py --sizes 100,1000 --latency 0.05
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from fake_servers import FakeAPIServer, FakeState  # noqa: E402
+
+
+SCENARIOS = (
+    'create_github_issues',
+    'create_trello_cards',
+    'sync_github_issues_to_trello_cards',
+    'sync_trello_cards_to_github_issues',
+    'bootstrap',
+)
+
+
+def write_issues_csv(directory, size):
+    filename = os.path.join(directory, 'issues.csv')
+    with open(filename, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(['title', 'body', 'labels'])
+        for index in range(size):
+            writer.writerow(['Benchmark issue {}'.format(index),
+                             'Body {}'.format(index), ''])
+    return filename
+
+
+def seed(scenario, size):
+    """Return the remote state a scenario starts from."""
+    if scenario == 'sync_github_issues_to_trello_cards':
+        return FakeState(issues=size)
+    if scenario == 'sync_trello_cards_to_github_issues':
+        return FakeState(cards=size)
+    if scenario == 'bootstrap':
+        return FakeState(issues=size, labels=min(size, 100))
+    return FakeState()
+
+
+def configure(trolley, server, directory, concurrency):
+    config = trolley.config
+    config.concurrency = concurrency
+    config.state_file = os.path.join(directory, 'state.sqlite')
+    config.journal_file = os.path.join(directory, 'journal.jsonl')
+    config.github.username = 'bench'
+    config.github.password = 'bench'
+    config.github.org = 'bench'
+    config.github.repo = 'repo'
+    config.github.cache_file = config.state_file
+    config.github.base_url = server.url
+    config.trello.app_key = 'bench'
+    config.trello.app_secret = 'bench'
+    config.trello.auth_token = 'bench'
+    config.trello.board_id = server.state.board_id
+    config.trello.base_url = server.url
+    return config
+
+
+def run_scenario(scenario, size, latency, page_size, concurrency):
+    """Run one scenario in this process and return its measurements."""
+    import trolley
+
+    state = seed(scenario, size)
+    server = FakeAPIServer(state, latency=latency, page_size=page_size).start()
+    directory = tempfile.mkdtemp(prefix='trolley-bench-')
+    config = configure(trolley, server, directory, concurrency)
+    filename = write_issues_csv(directory, size)
+    board = config.trello.board_id
+
+    # keep trolley's per-item output out of the report
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    start = time.time()
+    try:
+        if scenario == 'create_github_issues':
+            trolley.create_github_issues(config, 'bench', 'repo', filename)
+        elif scenario == 'create_trello_cards':
+            trolley.create_trello_cards(config, board, filename)
+        elif scenario == 'sync_github_issues_to_trello_cards':
+            trolley.sync_github_issues_to_trello_cards(config, 'bench', 'repo', board)
+        elif scenario == 'sync_trello_cards_to_github_issues':
+            trolley.sync_trello_cards_to_github_issues(config, board, 'bench', 'repo')
+        elif scenario == 'bootstrap':
+            os.chdir(os.path.dirname(HERE))
+            trolley.cli_bootstrap.callback('bench', 'repo')
+        elapsed = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        server.stop()
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024
+
+    return {
+        'scenario': scenario,
+        'size': size,
+        'seconds': round(elapsed, 3),
+        'github_requests': state.requests['github'],
+        'trello_requests': state.requests['trello'],
+        'bytes_received': state.bytes_sent,
+        'peak_memory_mb': round(peak / 1024.0 / 1024.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds the fake servers wait before answering')
+    parser.add_argument('--page-size', type=int, default=30)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--json', action='store_true')
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = run_scenario(args.scenarios, int(args.sizes), args.latency,
+                              args.page_size, args.concurrency)
+        print(json.dumps(result))
+        return
+
+    results = []
+    for scenario in args.scenarios.split(','):
+        for size in args.sizes.split(','):
+            output = subprocess.check_output([
+                sys.executable, __file__, '--single',
+                '--scenarios', scenario,
+                '--sizes', size,
+                '--latency', str(args.latency),
+                '--page-size', str(args.page_size),
+                '--concurrency', str(args.concurrency),
+            ])
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            results.append(result)
+            if not args.json:
+                print('{scenario:<38} {size:>7} {seconds:>9.2f}s '
+                      '{github_requests:>7} gh {trello_requests:>7} trello '
+                      '{peak_memory_mb:>7.1f}MB'.format(**result))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
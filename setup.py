@@ -8,7 +8,7 @@ setup(
     author_email='jeff.triplett@gmail.com',
     url='http://github.com/jefftriplett/trolley',
     packages=find_packages(),
-    py_modules=['trolley'],
+    py_modules=['trolley', 'trolley_async'],
     entry_points={
         'console_scripts': [
             'trolley=trolley:cli',
@@ -18,6 +18,10 @@ setup(
         'click',
         'click-config',
         'github3.py',
+        'requests',
         'git+https://github.com/sarumont/py-trello',
     ],
+    extras_require={
+        'async': ['aiohttp'],
+    },
 )
@@ -1,6 +1,16 @@
+import sys
+import time
+
 from invoke import run, task
 
 
+# SDKs that trolley must only import when a command needs them
+BACKENDS = ('buffpy', 'github3', 'trello')
+
+# slowest acceptable `trolley --version`, in seconds
+STARTUP_BUDGET = 0.5
+
+
 @task
 def build():
     run('python setup.py build')
@@ -18,3 +28,29 @@ def install():
 def pypi_upload():
     run('python setup.py sdist upload')
     run('python setup.py bdist_wheel upload')
+
+
+@task
+def benchmark_startup(runs=10):
+    """Time `trolley --version` and check no backend SDK is imported."""
+    run('python -c "import sys, trolley; '
+        'loaded = [name for name in {!r} if name in sys.modules]; '
+        'assert not loaded, loaded"'.format(BACKENDS))
+
+    timings = []
+    for _ in range(int(runs)):
+        start = time.time()
+        run('python trolley.py --version', hide=True)
+        timings.append(time.time() - start)
+
+    best = min(timings)
+    print('trolley --version: best {:.0f}ms of {} runs'.format(best * 1000, runs))
+    if best > STARTUP_BUDGET:
+        sys.exit('startup is over the {:.0f}ms budget'.format(STARTUP_BUDGET * 1000))
+
+
+@task
+def benchmark(sizes='100,1000,10000', latency=0.0, concurrency=1):
+    """Run the offline benchmarks against local fake GitHub and Trello APIs."""
+    run('python benchmarks/run.py --sizes {} --latency {} --concurrency {}'.format(
+        sizes, latency, concurrency))
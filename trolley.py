@@ -4,19 +4,47 @@ Trolley syncs issues between CSV, Github, and Buffer with Trello.
 
 """
 
+import base64
+import collections
 import csv
 import datetime
+import gzip
+import hashlib
+import hmac
+import itertools
+import json
+import operator
 import os
 import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from queue import Queue
+    from urllib.parse import quote
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from Queue import Queue
+    from urllib import quote
 
 import click
 import click_config
-import github3
+import requests
 
-from buffpy.api import API as BufferAPI
-from buffpy.managers.profiles import Profiles
-from buffpy.managers.updates import Updates
-from trello import TrelloClient
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from requests.structures import CaseInsensitiveDict
+
+# The github3, py-trello, and buffpy SDKs are slow to import, so each one
+# is imported inside the function that first needs it. Keep it that way:
+# `invoke benchmark_startup` fails if importing trolley loads any of them.
 
 
 __author__ = 'Jeff Triplett'
@@ -30,37 +58,118 @@ _buffer_auth = None
 _github_auth = None
 _trello_auth = None
 
+# hold per-run snapshots of remote state
+_github_snapshots = {}
+_trello_snapshots = {}
+_github_snapshots_lock = threading.Lock()
+
+# hold the label ids of boards changesets are applied to
+_trello_label_ids = {}
+_trello_label_ids_lock = threading.Lock()
+
+# hold the local sync state store
+_sync_state = None
+
+# hold the shared worker pool and per-service limits
+_executor = None
+_page_pool = None
+_service_semaphores = {}
+_governors = {}
+
+# hold the --profile collector
+_profiler = None
+
+# hold the bulk command journal
+_journal = None
+
+# where each service's SDK sends its requests
+API_URLS = {
+    'buffer': 'https://api.bufferapp.com',
+    'github': 'https://api.github.com',
+    'trello': 'https://api.trello.com',
+}
+
+# (requests, seconds) each service allows per token
+RATE_LIMITS = {
+    'buffer': (60, 60),
+    'github': (5000, 3600),
+    'trello': (100, 10),
+}
+
+TROLLEY_BATCH_SIZE = int(os.environ.get('TROLLEY_BATCH_SIZE', 100))
+TROLLEY_CONCURRENCY = int(os.environ.get('TROLLEY_CONCURRENCY', 1))
+TROLLEY_STATE_FILE = os.environ.get('TROLLEY_STATE_FILE', '.trolley.sqlite')
+TROLLEY_PROJECTS_FILE = os.environ.get('TROLLEY_PROJECTS_FILE')
+TROLLEY_JOURNAL_FILE = os.environ.get('TROLLEY_JOURNAL_FILE', '.trolley-journal.jsonl')
+TROLLEY_ENGINE = os.environ.get('TROLLEY_ENGINE', 'threads')
+TROLLEY_MAX_IN_FLIGHT = int(os.environ.get('TROLLEY_MAX_IN_FLIGHT', 100))
+TROLLEY_PREFETCH_PAGES = int(os.environ.get('TROLLEY_PREFETCH_PAGES', 4))
+TROLLEY_FUZZY_THRESHOLD = float(os.environ.get('TROLLEY_FUZZY_THRESHOLD', 0.9))
+
+# (connect, read) timeouts in seconds for every API call
+HTTP_TIMEOUT = (
+    float(os.environ.get('TROLLEY_CONNECT_TIMEOUT', 5)),
+    float(os.environ.get('TROLLEY_READ_TIMEOUT', 30)),
+)
+
 BUFFER_CLIENT_ID = os.environ.get('BUFFER_CLIENT_ID')
 BUFFER_CLIENT_SECRET = os.environ.get('BUFFER_CLIENT_SECRET')
 BUFFER_ACCESS_TOKEN = os.environ.get('BUFFER_ACCESS_TOKEN')
+BUFFER_MAX_CONCURRENCY = int(os.environ.get('BUFFER_MAX_CONCURRENCY', 2))
 
 GITHUB_USERNAME = os.environ.get('GITHUB_USERNAME')
 GITHUB_PASSWORD = os.environ.get('GITHUB_PASSWORD')
 GITHUB_ORG = os.environ.get('GITHUB_ORG')
 GITHUB_REPO = os.environ.get('GITHUB_REPO')
 GITHUB_SCOPES = ['user', 'repo']
+GITHUB_API_URL = API_URLS['github']
+GITHUB_BASE_URL = os.environ.get('GITHUB_BASE_URL')
+GITHUB_WEBHOOK_SECRET = os.environ.get('GITHUB_WEBHOOK_SECRET')
+GITHUB_GRAPHQL = os.environ.get('GITHUB_GRAPHQL', '').lower() in ('1', 'true', 'yes')
+GITHUB_MAX_CONCURRENCY = int(os.environ.get('GITHUB_MAX_CONCURRENCY', 4))
+GITHUB_CACHE_FILE = os.environ.get('GITHUB_CACHE_FILE', TROLLEY_STATE_FILE)
 
 TRELLO_APP_KEY = os.environ.get('TRELLO_APP_KEY')
 TRELLO_APP_SECRET = os.environ.get('TRELLO_APP_SECRET')
 TRELLO_AUTH_TOKEN = os.environ.get('TRELLO_AUTH_TOKEN')
 TRELLO_BOARD_ID = os.environ.get('TRELLO_BOARD_ID')
 TRELLO_DEFAULT_LIST = os.environ.get('TRELLO_DEFAULT_LIST', 'Uncategorized')
+TRELLO_MAX_CONCURRENCY = int(os.environ.get('TRELLO_MAX_CONCURRENCY', 8))
+TRELLO_BASE_URL = os.environ.get('TRELLO_BASE_URL')
+TRELLO_WEBHOOK_URL = os.environ.get('TRELLO_WEBHOOK_URL')
+TRELLO_BATCH_LIMIT = 10
 
 
 # might migrate to:
 #   http://click.pocoo.org/4/options/#values-from-environment-variables
 class config(object):
 
+    batch_size = TROLLEY_BATCH_SIZE
+    concurrency = TROLLEY_CONCURRENCY
+    state_file = TROLLEY_STATE_FILE
+    journal_file = TROLLEY_JOURNAL_FILE
+    resume = False
+    engine = TROLLEY_ENGINE
+    max_in_flight = TROLLEY_MAX_IN_FLIGHT
+    prefetch_pages = TROLLEY_PREFETCH_PAGES
+    fuzzy_threshold = TROLLEY_FUZZY_THRESHOLD
+
     class buffer(object):
         client_id = BUFFER_CLIENT_ID
         client_secret = BUFFER_CLIENT_SECRET
         access_token = BUFFER_ACCESS_TOKEN
+        max_concurrency = BUFFER_MAX_CONCURRENCY
 
     class github(object):
         username = GITHUB_USERNAME
         password = GITHUB_PASSWORD
         org = GITHUB_ORG
         repo = GITHUB_REPO
+        max_concurrency = GITHUB_MAX_CONCURRENCY
+        cache_file = GITHUB_CACHE_FILE
+        graphql = GITHUB_GRAPHQL
+        base_url = GITHUB_BASE_URL
+        webhook_secret = GITHUB_WEBHOOK_SECRET
 
     class trello(object):
         app_key = TRELLO_APP_KEY
@@ -68,6 +177,13 @@ class config(object):
         auth_token = TRELLO_AUTH_TOKEN
         board_id = TRELLO_BOARD_ID
         default_list = TRELLO_DEFAULT_LIST
+        max_concurrency = TRELLO_MAX_CONCURRENCY
+        base_url = TRELLO_BASE_URL
+        webhook_url = TRELLO_WEBHOOK_URL
+
+    class projects(object):
+        filename = TROLLEY_PROJECTS_FILE
+        pairs = []
 
 
 # utils
@@ -79,6 +195,249 @@ def csv_to_dict_list(filename):
     return values
 
 
+def iter_csv_rows(filename):
+    """Yield each row of a CSV file as a dict without reading it all in."""
+    with open(filename) as f:
+        for row in csv.DictReader(f):
+            yield row
+
+
+def iter_batches(items, size):
+    """Yield lists of up to size items from any iterable."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def split_labels(labels):
+    """Turn a CSV labels cell ("a,b") into a list of label names."""
+    if not labels:
+        return []
+    return [label for label in labels.split(',') if label]
+
+
+def iter_issue_rows(filename):
+    """Yield (title, body, labels) for each valid row of an issues CSV."""
+    for line, row in enumerate(iter_csv_rows(filename), 2):
+        title = str(row.get('title') or '').strip()
+        if not title:
+            click.echo('skipping line {}: missing title'.format(line), err=True)
+            continue
+        body = str(row.get('body') or '')
+        yield title, body, split_labels(row.get('labels'))
+
+
+def normalize_title(title):
+    """Return a title folded for matching (unicode form, case, whitespace)."""
+    if title is None:
+        title = ''
+    if isinstance(title, bytes):
+        title = title.decode('utf-8')
+    title = unicodedata.normalize('NFKC', title)
+    title = re.sub(r'\s+', ' ', title).strip()
+    return title.lower()
+
+
+class TitleIndex(object):
+    """Map normalized titles to remote object ids for O(1) lookups.
+
+    With a fuzzy_threshold, titles are also kept in a FuzzyIndex so match()
+    and find() fall back to a near duplicate when there is no exact one.
+    """
+
+    def __init__(self, fuzzy_threshold=0):
+        self._ids = {}
+        self._items = {}
+        self.fuzzy = FuzzyIndex(fuzzy_threshold) if fuzzy_threshold else None
+
+    def key(self, title):
+        return normalize_title(title)
+
+    def __contains__(self, title):
+        return self.key(title) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, title, id, item=None):
+        key = self.key(title)
+        replaced = self._ids.get(key)
+        self._ids[key] = id
+        if item is not None:
+            self._items[id] = item
+        if self.fuzzy is not None:
+            # a duplicate title takes over the key; the id it displaced can
+            # no longer be discarded by title, so it leaves the buckets now
+            if replaced is not None and replaced != id:
+                self.fuzzy.discard(replaced)
+            self.fuzzy.add(title, id)
+
+    def discard(self, title, id=None):
+        key = self.key(title)
+        if id is None or self._ids.get(key) == id:
+            id = self._ids.pop(key, None)
+        self._items.pop(id, None)
+        if self.fuzzy is not None:
+            self.fuzzy.discard(id)
+
+    def get_id(self, title, default=None):
+        return self._ids.get(self.key(title), default)
+
+    def get(self, title, default=None):
+        id = self.get_id(title)
+        if id is None:
+            return default
+        return self._items.get(id, default)
+
+    def item(self, id, default=None):
+        return self._items.get(id, default)
+
+    def match(self, title):
+        """Return the id of the title or, failing that, of a near duplicate."""
+        id = self.get_id(title)
+        if id is None and self.fuzzy is not None:
+            found = self.fuzzy.match(title)
+            if found is not None:
+                id, other, score = found
+                click.echo('"{}" is a near match for "{}" ({:.0%} similar)'.format(
+                    title, other, score))
+        return id
+
+    def find(self, title, default=None):
+        id = self.match(title)
+        if id is None:
+            return default
+        return self._items.get(id, default)
+
+
+class FuzzyIndex(object):
+    """Find near duplicate titles without comparing against every title.
+
+    Each title is cut into character trigrams and summarized by a MinHash
+    signature. The signature is split into bands and each band is bucketed,
+    so a query is only compared against titles that share a bucket with it
+    (locality sensitive hashing). Those few candidates are then scored by
+    the Jaccard similarity of their trigrams.
+
+    Titles whose numbers differ ("Iteration 1", "Iteration 2") never match,
+    nor do titles left empty once punctuation is stripped.
+    Signatures are only worked out once the first query is made, so an
+    index that is never asked costs no more than its titles.
+    """
+
+    bands = 8
+    prime = (1 << 61) - 1
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        # the most rows per band (the fewest candidates) that still makes
+        # titles at the threshold candidates at least 95% of the time
+        self.rows = next((rows for rows in (4, 3, 2)
+                          if 1 - (1 - threshold ** rows) ** self.bands >= 0.95), 1)
+        rng = random.Random(self.bands * self.rows)
+        self._seeds = [(rng.randrange(1, self.prime), rng.randrange(0, self.prime))
+                       for _ in range(self.bands * self.rows)]
+        self._titles = {}
+        self._keys = None
+        self._buckets = collections.defaultdict(list)
+        self._hashes = {}
+
+    def shingle(self, title):
+        text = re.sub(r'[^\w\s]', '', normalize_title(title))
+        text = re.sub(r'\s+', ' ', text).strip()
+        if not text:
+            return set(), ()
+        grams = set(text[i:i + 3] for i in range(max(len(text) - 2, 1)))
+        return grams, tuple(re.findall(r'[0-9]+', text))
+
+    def signature(self, grams):
+        # titles share most of their trigrams, so each trigram's hashes are
+        # worked out once and a signature is a column-wise min over them
+        hashes = self._hashes
+        for gram in grams:
+            if gram not in hashes:
+                h = hash(gram) & 0xffffffff
+                hashes[gram] = tuple((a * h + b) % self.prime & 0xffffffff
+                                     for a, b in self._seeds)
+        return [min(column) for column in zip(*[hashes[gram] for gram in grams])]
+
+    def band_keys(self, signature):
+        rows = self.rows
+        return [hash((i,) + tuple(signature[i:i + rows]))
+                for i in range(0, len(signature), rows)]
+
+    def add(self, title, id):
+        self.discard(id)
+        self._titles[id] = title
+        if self._keys is not None:
+            self._bucket(id, title)
+
+    def _bucket(self, id, title):
+        # the trigrams are not kept; candidates are cut up again when scored
+        keys = self.band_keys(self.signature(self.shingle(title)[0]))
+        self._keys[id] = keys
+        for key in keys:
+            self._buckets[key].append(id)
+
+    def discard(self, id):
+        if id not in self._titles:
+            return
+        del self._titles[id]
+        if self._keys is None:
+            return
+        for key in self._keys.pop(id):
+            bucket = self._buckets[key]
+            bucket.remove(id)
+            if not bucket:
+                del self._buckets[key]
+
+    def matches(self, title):
+        """Return (id, title, score) for every near duplicate, best first."""
+        if self._keys is None:
+            self._keys = {}
+            for id, other in self._titles.items():
+                self._bucket(id, other)
+
+        grams, numbers = self.shingle(title)
+        if not grams:
+            # titles of only punctuation or emoji have nothing to compare
+            return []
+        candidates = set()
+        for key in self.band_keys(self.signature(grams)):
+            candidates.update(self._buckets.get(key, ()))
+
+        found = []
+        for id in candidates:
+            other = self._titles[id]
+            other_grams, other_numbers = self.shingle(other)
+            if other_numbers != numbers:
+                continue
+            score = len(grams & other_grams) / float(len(grams | other_grams))
+            if score >= self.threshold:
+                found.append((id, other, score))
+        found.sort(key=lambda match: -match[2])
+        return found
+
+    def match(self, title):
+        found = self.matches(title)
+        return found[0] if found else None
+
+
+class TextIndex(TitleIndex):
+    """A TitleIndex keyed by a digest of each text instead of the text.
+
+    Post bodies can be long, so only a fixed size hash is kept per text.
+    """
+
+    def key(self, text):
+        return hashlib.sha1(normalize_title(text).encode('utf-8')).hexdigest()
+
+
 def get_random_color():
     filename = 'etc/color-blind-safe.csv'
     colors = csv_to_dict_list(filename)
@@ -86,6 +445,173 @@ def get_random_color():
     return colors[index]['color']
 
 
+def get_executor(config):
+    """Return the worker pool shared by every bulk command."""
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPool(max(config.concurrency, 1))
+    return _executor
+
+
+def get_page_pool(config):
+    """Return the pool that fetches listing pages ahead of their readers.
+
+    It is kept apart from the worker pool so a bulk command's workers can
+    read listings without waiting on themselves.
+    """
+    global _page_pool
+
+    if _page_pool is None:
+        _page_pool = ThreadPool(max(config.prefetch_pages, 1))
+    return _page_pool
+
+
+def prefetch(config, func, items):
+    """Yield func(item) for each item in order, running ahead of the reader.
+
+    Up to config.prefetch_pages calls are in flight while the caller works
+    on the result it was just given.
+    """
+    if config.prefetch_pages < 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = get_page_pool(config)
+    items = iter(items)
+    pending = collections.deque(pool.apply_async(func, (item,)) for item in
+                                itertools.islice(items, config.prefetch_pages))
+    while pending:
+        with profile_phase('fetch'):
+            result = pending.popleft().get()
+        for item in itertools.islice(items, 1):
+            pending.append(pool.apply_async(func, (item,)))
+        yield result
+
+
+def get_service_semaphore(config, service):
+    """Return the semaphore capping concurrent calls to one service."""
+    if service not in _service_semaphores:
+        limit = getattr(config, service).max_concurrency
+        _service_semaphores[service] = threading.BoundedSemaphore(max(limit, 1))
+    return _service_semaphores[service]
+
+
+def execute(config, service, func, items):
+    """Call func for each item and yield (item, result, error) tuples.
+
+    Calls run on the shared worker pool when config.concurrency is above
+    one, but never more than the service's max_concurrency at a time.
+    Results are yielded as they finish so callers can report each item.
+    """
+    semaphore = get_service_semaphore(config, service)
+
+    def call(item):
+        with semaphore:
+            try:
+                return item, func(item), None
+            except Exception as e:
+                return item, None, e
+
+    if config.concurrency <= 1:
+        for item in items:
+            yield call(item)
+        return
+
+    for outcome in get_executor(config).imap_unordered(call, items):
+        yield outcome
+
+
+class Tally(object):
+    """Echo and count the per-item outcomes of a bulk command.
+
+    When the total is known each line is prefixed with the progress so far.
+    """
+
+    def __init__(self, verb, noun, total=None):
+        self.verb = verb
+        self.noun = noun
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+
+    def record(self, name, error=None):
+        progress = ''
+        if self.total:
+            progress = '[{}/{}] '.format(self.succeeded + self.failed + 1, self.total)
+        if error is None:
+            self.succeeded += 1
+            click.echo('{}{} {} "{}"'.format(progress, self.verb, self.noun, name))
+        else:
+            self.failed += 1
+            click.echo('{}{} "{}" failed: {}'.format(
+                progress, self.noun, name, error), err=True)
+
+    def echo_summary(self):
+        click.echo('{} {} {}s, {} failed'.format(
+            self.verb, self.succeeded, self.noun, self.failed))
+
+
+def create_in_batches(config, service, noun, rows, load_existing, create, add,
+                      step=None, key=None):
+    """Dedupe and create a stream of rows one batch at a time.
+
+    Each batch is checked against the existing index, submitted through
+    execute(), and its results are passed to add() before the next batch
+    is read, so memory stays bounded by config.batch_size.
+
+    Rows are deduped and journaled by key(row), their first column unless
+    another key is given.
+
+    load_existing() is only called once a row needs checking, so rows a
+    resumed journal step already finished cost no remote reads.
+    """
+    if key is None:
+        key = operator.itemgetter(0)
+    tally = Tally('created', noun)
+    existing = None
+    resumed = 0
+    for batch in iter_batches(rows, config.batch_size):
+        if step is not None:
+            remaining = [row for row in batch
+                         if not step.is_done(normalize_title(key(row)))]
+            resumed += len(batch) - len(remaining)
+            batch = remaining
+        if not batch:
+            continue
+        if existing is None:
+            existing = load_existing()
+
+        queued = set()
+        new_rows = []
+        with profile_phase('diff'):
+            for row in batch:
+                title, row_key = row[0], key(row)
+                if existing.match(row_key) is not None or normalize_title(row_key) in queued:
+                    click.echo('{} "{}" already exists'.format(noun, title))
+                    if step is not None:
+                        step.done(normalize_title(row_key))
+                else:
+                    click.echo('creating {} "{}"'.format(noun, title))
+                    queued.add(normalize_title(row_key))
+                    new_rows.append(row)
+
+        with profile_phase('write'):
+            for row, item, error in execute(config, service, create, new_rows):
+                if error is None:
+                    add(item)
+                    if step is not None:
+                        step.done(normalize_title(key(row)))
+                tally.record(row[0], error)
+    if resumed:
+        click.echo('skipped {} {}s finished by an earlier run'.format(resumed, noun))
+    tally.echo_summary()
+    if step is not None and not tally.failed:
+        step.finish()
+    return tally
+
+
 def print_version(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
@@ -93,6 +619,547 @@ def print_version(ctx, param, value):
     ctx.exit()
 
 
+# journal
+
+class Journal(object):
+    """JSON lines file of the work bulk commands have finished.
+
+    Each command records the items it completes under a scope named after
+    the command and its arguments, and marks the scope finished when it
+    ends without failures. A command started normally resets its scope.
+    With --resume the recorded items, and whole finished scopes, are
+    skipped without looking at either service.
+
+    Nothing is written until a command records work, and a finished
+    scope's items are compacted into a single line. A run without
+    --resume removes a journal whose scopes have all finished, so the
+    file only outlives a run while there is something left to resume.
+    """
+
+    def __init__(self, filename, resume=False):
+        self.filename = filename
+        self.resume = resume
+        self._lock = threading.Lock()
+        self._done = {}
+        self._finished = set()
+        self._file = None
+        self._torn = False
+        if os.path.exists(filename):
+            line = '\n'
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # the last line may have been cut short by a crash
+                        continue
+                    self._apply(entry)
+            self._torn = not line.endswith('\n')
+            if not resume and not self._pending():
+                # the last run finished everything it started
+                self._done.clear()
+                self._finished.clear()
+                os.remove(filename)
+
+    def _apply(self, entry):
+        scope = entry['scope']
+        event = entry['event']
+        if event == 'begin':
+            self._done[scope] = set()
+            self._finished.discard(scope)
+        elif event == 'done':
+            self._done.setdefault(scope, set()).add(entry['key'])
+        elif event == 'finish':
+            self._finished.add(scope)
+
+    def is_done(self, scope, key):
+        return key in self._done.get(scope, ())
+
+    def is_finished(self, scope):
+        return scope in self._finished
+
+    def is_known(self, scope):
+        return scope in self._done or scope in self._finished
+
+    def _pending(self):
+        return [scope for scope in self._done if scope not in self._finished]
+
+    def append(self, scope, event, key=None):
+        entry = {'scope': scope, 'event': event}
+        if key is not None:
+            entry['key'] = key
+        with self._lock:
+            self._apply(entry)
+            if self._file is None:
+                self._file = open(self.filename, 'a')
+                if self._torn:
+                    self._file.write('\n')
+                    self._torn = False
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+            if event == 'finish':
+                self._compact()
+
+    def _compact(self):
+        # keep each finished scope as one line, and the items of the rest
+        self._file.close()
+        self._file = None
+        for scope in self._finished:
+            self._done.pop(scope, None)
+        entries = [{'scope': scope, 'event': 'finish'} for scope in sorted(self._finished)]
+        for scope in self._pending():
+            entries.append({'scope': scope, 'event': 'begin'})
+            entries.extend({'scope': scope, 'event': 'done', 'key': key}
+                           for key in sorted(self._done[scope]))
+        compacted = self.filename + '.tmp'
+        with open(compacted, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(compacted, self.filename)
+
+    def step(self, *parts):
+        """Return the JournalStep for a command run with these arguments."""
+        return JournalStep(self, ':'.join(str(part) for part in parts))
+
+
+class JournalStep(object):
+
+    def __init__(self, journal, scope):
+        self.journal = journal
+        self.scope = scope
+        # a begin record only matters when it resets an earlier run's
+        if not journal.resume and journal.is_known(scope):
+            journal.append(scope, 'begin')
+
+    def skip_if_finished(self):
+        if self.journal.is_finished(self.scope):
+            click.echo('skipping {}, an earlier run finished it'.format(self.scope))
+            return True
+        return False
+
+    def is_done(self, key):
+        return self.journal.is_done(self.scope, str(key))
+
+    def done(self, key):
+        self.journal.append(self.scope, 'done', str(key))
+
+    def finish(self):
+        self.journal.append(self.scope, 'finish')
+
+
+def get_journal(config):
+    """Open the bulk command journal once and return it."""
+    global _journal
+
+    if _journal is None:
+        _journal = Journal(config.journal_file, resume=config.resume)
+    return _journal
+
+
+# rate limits
+
+class RateGovernor(object):
+    """Token bucket that keeps one service's calls under its rate limit.
+
+    Tokens refill at ``limit / period`` per second and each request takes
+    one. Rate-limit headers on responses (GitHub's ``X-RateLimit-*`` and
+    Trello's ``x-rate-limit-api-token-*``) correct the bucket, and when the
+    service reports the budget as spent every caller pauses until reset.
+    """
+
+    def __init__(self, service, limit, period, headroom=0.9):
+        self.service = service
+        self.limit = limit
+        self.period = period
+        self.capacity = max(limit * headroom, 1)
+        self.rate = self.capacity / float(period)
+        self.tokens = self.capacity
+        self.remaining = None
+        self.reset_at = None
+        self.waited = 0.0
+        self._checked_at = time.time()
+        self._lock = threading.Lock()
+
+    def _sleep(self, seconds):
+        time.sleep(seconds)
+        self.waited += seconds
+
+    def acquire(self):
+        """Block until the next request fits in the budget."""
+        with self._lock:
+            while True:
+                now = time.time()
+                if self.remaining is not None and self.remaining <= 0:
+                    if self.reset_at and self.reset_at > now:
+                        self._sleep(self.reset_at - now)
+                        continue
+                    self.remaining = None
+
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self._checked_at) * self.rate)
+                self._checked_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+                self._sleep((1 - self.tokens) / self.rate)
+
+    def update(self, response):
+        """Correct the budget from a response's rate-limit headers."""
+        headers = response.headers
+        remaining = (headers.get('X-RateLimit-Remaining') or
+                     headers.get('x-rate-limit-api-token-remaining'))
+        reset = headers.get('X-RateLimit-Reset')
+        interval = headers.get('x-rate-limit-api-token-interval-ms')
+        retry_after = headers.get('Retry-After')
+
+        with self._lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+                self.tokens = min(self.tokens, self.remaining)
+            if reset is not None:
+                self.reset_at = float(reset)
+            elif interval is not None:
+                self.reset_at = time.time() + int(interval) / 1000.0
+            if self.is_limited(response):
+                self.remaining = 0
+                if retry_after is not None:
+                    self.reset_at = time.time() + float(retry_after)
+                elif not self.reset_at or self.reset_at <= time.time():
+                    self.reset_at = time.time() + self.period
+
+    def is_limited(self, response):
+        if response.status_code == 429:
+            return True
+        return (response.status_code == 403 and
+                response.headers.get('X-RateLimit-Remaining') == '0')
+
+    def status(self):
+        """Return a one-line description of the remaining budget."""
+        remaining = self.remaining
+        if remaining is None:
+            remaining = int(self.tokens)
+        message = '{}: {}/{} requests left'.format(self.service, remaining, self.limit)
+        if self.reset_at and self.reset_at > time.time():
+            message += ', resets in {:.0f}s'.format(self.reset_at - time.time())
+        if self.waited:
+            message += ', waited {:.1f}s'.format(self.waited)
+        return message
+
+
+class HTTPCache(object):
+    """On-disk store of GET responses used to make conditional requests.
+
+    Responses carrying an ``ETag`` or ``Last-Modified`` header are kept by
+    URL. Later GETs for the same URL send ``If-None-Match`` and
+    ``If-Modified-Since``, and a ``304 Not Modified`` is answered from the
+    stored body. GitHub does not count 304s against the rate limit.
+    """
+
+    # headers from a 304 that describe the request rather than the content
+    fresh_headers = (
+        'Date',
+        'X-RateLimit-Limit',
+        'X-RateLimit-Remaining',
+        'X-RateLimit-Reset',
+    )
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS http_cache (
+                    url TEXT PRIMARY KEY,
+                    etag TEXT,
+                    last_modified TEXT,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL
+                )""")
+
+    def _get(self, url):
+        with self._lock:
+            return self.connection.execute(
+                'SELECT * FROM http_cache WHERE url = ?', (url,)).fetchone()
+
+    def prepare(self, request):
+        """Add conditional headers to a GET we have a cached copy of."""
+        if request.method != 'GET':
+            return
+        if 'If-None-Match' in request.headers:
+            return
+        row = self._get(request.url)
+        if row is None:
+            return
+        if row['etag']:
+            request.headers['If-None-Match'] = row['etag']
+        if row['last_modified']:
+            request.headers['If-Modified-Since'] = row['last_modified']
+
+    def update(self, request, response):
+        """Store a fresh response, or replay the cached one for a 304."""
+        if request.method != 'GET':
+            return response
+
+        if response.status_code == 304:
+            row = self._get(request.url)
+            if row is None:
+                return response
+            headers = CaseInsensitiveDict(json.loads(row['headers']))
+            for name in self.fresh_headers:
+                if name in response.headers:
+                    headers[name] = response.headers[name]
+            response.status_code = 200
+            response.headers = headers
+            response._content = bytes(row['body'])
+            response._content_consumed = True
+            return response
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code == 200 and (etag or last_modified):
+            with self._lock, self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO http_cache VALUES (?, ?, ?, ?, ?)',
+                    (request.url, etag, last_modified,
+                     json.dumps(dict(response.headers)),
+                     sqlite3.Binary(response.content)))
+        return response
+
+
+class GovernedAdapter(HTTPAdapter):
+    """Transport adapter that sends every request through a RateGovernor.
+
+    Requests rejected for exceeding the rate limit are retried once the
+    governor's reset time has passed. With an HTTPCache, GETs are sent as
+    conditional requests and unchanged responses come from disk. With a
+    rewrite of (url, base_url), requests are sent to base_url instead,
+    which is how the benchmarks point the SDKs at local stand-ins.
+    """
+
+    def __init__(self, governor, cache=None, rewrite=None, timeout=None,
+                 rate_limit_retries=3, **kwargs):
+        self.governor = governor
+        self.cache = cache
+        self.rewrite = rewrite
+        self.timeout = timeout
+        self.rate_limit_retries = rate_limit_retries
+        super(GovernedAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        # requests has no session-wide timeout, so apply ours here
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+
+        if self.rewrite and request.url.startswith(self.rewrite[0]):
+            request.url = self.rewrite[1] + request.url[len(self.rewrite[0]):]
+
+        if self.cache is not None:
+            self.cache.prepare(request)
+
+        started = time.time()
+        waited = 0.0
+        attempt = 0
+        while True:
+            acquired = time.time()
+            self.governor.acquire()
+            waited += time.time() - acquired
+            response = super(GovernedAdapter, self).send(request, **kwargs)
+            self.governor.update(response)
+            if (not self.governor.is_limited(response) or
+                    attempt >= self.rate_limit_retries):
+                break
+            attempt += 1
+
+        if _profiler is not None:
+            _profiler.record(self.governor.service, request, response,
+                             time.time() - started - waited, attempt, waited)
+
+        if self.cache is not None:
+            response = self.cache.update(request, response)
+        return response
+
+
+def get_governor(service):
+    """Return the RateGovernor shared by every client of a service."""
+    if service not in _governors:
+        limit, period = RATE_LIMITS[service]
+        _governors[service] = RateGovernor(service, limit, period)
+    return _governors[service]
+
+
+def configure_session(session, service, pool_size, cache=None, base_url=None):
+    """Set up the requests session an API client makes its calls with.
+
+    Every client (github3, py-trello, and Buffer) gets the same treatment:
+    a keep-alive connection pool sized to the service's concurrency so TLS
+    connections are reused instead of renegotiated, gzip responses,
+    connect/read timeouts, retries for failed connects, and the service's
+    RateGovernor.
+    """
+    rewrite = None
+    if base_url:
+        rewrite = (API_URLS[service], base_url.rstrip('/'))
+    adapter = GovernedAdapter(
+        get_governor(service),
+        cache=cache,
+        rewrite=rewrite,
+        timeout=HTTP_TIMEOUT,
+        pool_connections=1,
+        pool_maxsize=max(pool_size, 1),
+        max_retries=Retry(total=3, connect=3, read=0, backoff_factor=0.5),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+
+# profiling
+
+class Profiler(object):
+    """Collect API call statistics and phase timings for --profile.
+
+    Every request made through a GovernedAdapter is counted by service,
+    method and endpoint (ids in the path are folded to ``:id``) with its
+    latency histogram, bytes, retries and rate-limit waits. Commands mark
+    their fetch, diff and write phases with profile_phase().
+    """
+
+    # latency histogram bucket upper bounds, in seconds
+    buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float('inf'))
+
+    def __init__(self):
+        self.started = time.time()
+        self.endpoints = {}
+        self.phases = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def phase_stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def endpoint(self, url):
+        path = url.split('?', 1)[0].split('://', 1)[-1]
+        path = '/' + path.split('/', 1)[-1] if '/' in path else '/'
+        # keep the leading api version (Trello's /1/) but fold ids after it
+        return re.sub(r'(?<=.)/([0-9]+|[0-9a-f]{24})(?=/|$)', '/:id', path)
+
+    def record(self, service, request, response, seconds, retries, waited):
+        key = (service, request.method, self.endpoint(request.url))
+        sent = len(request.body or b'')
+        received = int(response.headers.get('Content-Length') or len(response.content))
+        with self._lock:
+            stats = self.endpoints.setdefault(key, {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'seconds': 0.0,
+                'rate_limit_wait': 0.0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'histogram': [0] * len(self.buckets),
+            })
+            stats['requests'] += 1
+            stats['errors'] += 1 if response.status_code >= 400 else 0
+            stats['retries'] += retries
+            stats['seconds'] += seconds
+            stats['rate_limit_wait'] += waited
+            stats['bytes_sent'] += sent
+            stats['bytes_received'] += received
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    stats['histogram'][index] += 1
+                    break
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def percentile(self, histogram, fraction):
+        """Return the bucket bound under which fraction of calls finished."""
+        wanted = sum(histogram) * fraction
+        seen = 0
+        for bound, count in zip(self.buckets, histogram):
+            seen += count
+            if seen >= wanted:
+                return bound
+        return self.buckets[-1]
+
+    def report(self):
+        wall = time.time() - self.started
+        endpoints = []
+        for (service, method, path), stats in sorted(self.endpoints.items()):
+            row = dict(stats, service=service, method=method, endpoint=path)
+            row['p50'] = self.percentile(stats['histogram'], 0.5)
+            row['p95'] = self.percentile(stats['histogram'], 0.95)
+            endpoints.append(row)
+        network = sum(row['seconds'] for row in endpoints)
+        return {
+            'wall_seconds': wall,
+            'network_seconds': network,
+            'rate_limit_wait_seconds': sum(row['rate_limit_wait'] for row in endpoints),
+            'phases': self.phases,
+            'histogram_buckets': [str(bound) for bound in self.buckets],
+            'endpoints': endpoints,
+        }
+
+    def echo(self):
+        report = self.report()
+        click.echo('', err=True)
+        click.echo('{:<8} {:<6} {:<44} {:>6} {:>4} {:>4} {:>8} {:>7} {:>7} {:>10}'.format(
+            'service', 'method', 'endpoint', 'calls', 'err', 'rtry',
+            'total', 'p50', 'p95', 'bytes in'), err=True)
+        for row in report['endpoints']:
+            click.echo('{:<8} {:<6} {:<44} {:>6} {:>4} {:>4} {:>7.2f}s {:>7} {:>7} {:>10}'.format(
+                row['service'], row['method'], row['endpoint'][-44:],
+                row['requests'], row['errors'], row['retries'], row['seconds'],
+                '<{:g}s'.format(row['p50']), '<{:g}s'.format(row['p95']),
+                row['bytes_received']), err=True)
+        click.echo('', err=True)
+        for name, seconds in sorted(report['phases'].items()):
+            click.echo('phase {:<20} {:>8.2f}s'.format(name, seconds), err=True)
+        click.echo('wall time {:>24.2f}s'.format(report['wall_seconds']), err=True)
+        click.echo('time in API calls {:>16.2f}s'.format(report['network_seconds']), err=True)
+        click.echo('rate limit waits {:>17.2f}s'.format(
+            report['rate_limit_wait_seconds']), err=True)
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+@contextmanager
+def profile_phase(name):
+    """Time a phase of a command when --profile is on.
+
+    Phases nest: time spent in an inner phase is only counted there, not
+    again in the phase around it.
+    """
+    if _profiler is None:
+        yield
+        return
+
+    stack = _profiler.phase_stack()
+    inner = [0.0]
+    stack.append(inner)
+    started = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - started
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        _profiler.add_phase(name, elapsed - inner[0])
+
+
 # github utils
 
 def get_github_auth(github_config):
@@ -105,98 +1172,606 @@ def get_github_auth(github_config):
     assert github_config.username
     assert github_config.password
 
+    import github3
+
     _github_auth = github3.login(
         github_config.username,
         github_config.password)
+    session = getattr(_github_auth, 'session', None) or _github_auth._session
+    cache = HTTPCache(github_config.cache_file) if github_config.cache_file else None
+    configure_session(session, 'github', github_config.max_concurrency,
+                      cache=cache, base_url=github_config.base_url)
 
     return _github_auth
 
 
 def get_github_repository(config, github_org, github_repo):
     """Return a repository object and log me in."""
-    github = get_github_auth(config.github)
-    repository = github.repository(github_org, github_repo)
-    return repository
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    return snapshot.repository
+
+
+def get_github_session(repository):
+    return getattr(repository, 'session', None) or repository._session
+
+
+def get_github_page(session, url, params=None):
+    response = session.get(url, params=params)
+    response.raise_for_status()
+    return response
+
+
+def iter_github_pages(config, session, url, params=None):
+    """Yield each page of a GitHub REST listing as a list of dicts.
+
+    The first page's ``last`` link gives the page count, so the pages after
+    it are fetched config.prefetch_pages at a time while earlier ones are
+    being read. Listings without one follow ``next`` links a page ahead.
+    """
+    response = get_github_page(session, url, dict(params or {}, per_page=100))
+    last = response.links.get('last', {}).get('url')
+    if last:
+        count = int(re.search(r'[?&]page=([0-9]+)', last).group(1))
+        urls = [re.sub(r'([?&]page=)[0-9]+', r'\g<1>{}'.format(page), last)
+                for page in range(2, count + 1)]
+        yield response.json()
+        for response in prefetch(config, lambda url: get_github_page(session, url), urls):
+            yield response.json()
+        return
+
+    while response is not None:
+        # the next link already carries the query string
+        url = response.links.get('next', {}).get('url')
+        upcoming = None
+        if url and config.prefetch_pages > 0:
+            upcoming = get_page_pool(config).apply_async(get_github_page, (session, url))
+        yield response.json()
+        if upcoming is not None:
+            with profile_phase('fetch'):
+                response = upcoming.get()
+        else:
+            response = get_github_page(session, url) if url else None
+
+
+def issue_to_dict(issue):
+    """Return the fields trolley keeps for an issue as a dict.
+
+    Takes an IssueRecord, a github3 issue, or the JSON of a REST issue or
+    webhook payload.
+    """
+    if isinstance(issue, IssueRecord):
+        data = dict((name, getattr(issue, name)) for name in IssueRecord.__slots__)
+        data['url'] = issue.url
+        return data
+    issue = github_json(issue)
+    return {
+        'url': issue['url'],
+        'number': issue['number'],
+        'title': issue['title'],
+        'body': issue['body'],
+        'state': issue['state'],
+        'labels': [label['name'] if isinstance(label, dict) else label
+                   for label in issue.get('labels') or []],
+        'updated_at': issue['updated_at'],
+    }
+
+
+def github_json(item):
+    """Return the REST JSON of a github3 object, or the JSON itself."""
+    if isinstance(item, dict):
+        return item
+    return item.as_dict() if hasattr(item, 'as_dict') else item.to_json()
+
+
+def issue_from_dict(data, repository):
+    """Build an IssueRecord bound to the repository's session."""
+    fields = issue_to_dict(data)
+    return make_record(IssueRecord, get_github_session(repository),
+                       fields.pop('url'), **fields)
+
+
+def label_from_dict(data, repository):
+    """Build a LabelRecord from a github3 label or its JSON."""
+    data = github_json(data)
+    return make_record(LabelRecord, get_github_session(repository), data['url'],
+                       name=data['name'], color=data['color'])
+
+
+def milestone_from_dict(data, repository):
+    """Build a MilestoneRecord from a github3 milestone or its JSON."""
+    data = github_json(data)
+    return make_record(MilestoneRecord, get_github_session(repository), data['url'],
+                       number=data['number'], title=data['title'])
+
+
+GITHUB_GRAPHQL_QUERY = """
+query($owner: String!, $name: String!,
+      $issues: Boolean!, $issuesAfter: String,
+      $labels: Boolean!, $labelsAfter: String,
+      $milestones: Boolean!, $milestonesAfter: String) {
+  repository(owner: $owner, name: $name) {
+    issues(first: 100, after: $issuesAfter, states: OPEN) @include(if: $issues) {
+      pageInfo { hasNextPage endCursor }
+      nodes { number title body state updatedAt labels(first: 50) { nodes { name } } }
+    }
+    labels(first: 100, after: $labelsAfter) @include(if: $labels) {
+      pageInfo { hasNextPage endCursor }
+      nodes { name color }
+    }
+    milestones(first: 100, after: $milestonesAfter, states: OPEN) @include(if: $milestones) {
+      pageInfo { hasNextPage endCursor }
+      nodes { number title }
+    }
+  }
+}
+"""
+
+
+class GithubRecord(object):
+    """Base for the projected GitHub objects the GraphQL and REST loaders build.
+
+    Records keep only the fields trolley reads plus the session and REST
+    url needed for the few writes trolley makes to existing objects.
+    """
+
+    __slots__ = ('session', 'url')
+
+    def _request(self, method, data=None):
+        if data is not None:
+            data = json.dumps(data)
+        response = self.session.request(method, self.url, data=data)
+        response.raise_for_status()
+        return response
+
+
+class IssueRecord(GithubRecord):
+
+    __slots__ = ('number', 'title', 'body', 'state', 'labels', 'updated_at')
+
+    def edit(self, title=None, body=None, state=None, labels=None):
+        data = dict((key, value) for key, value in
+                    (('title', title), ('body', body), ('state', state),
+                     ('labels', labels))
+                    if value is not None)
+        updated = self._request('PATCH', data).json()
+        self.title = updated['title']
+        self.body = updated['body']
+        self.state = updated['state']
+        self.labels = [label['name'] for label in updated['labels']]
+        self.updated_at = updated['updated_at']
+        return True
+
+    def close(self):
+        return self.edit(state='closed')
+
+    def reopen(self):
+        return self.edit(state='open')
+
+
+class LabelRecord(GithubRecord):
+
+    __slots__ = ('name', 'color')
+
+    def delete(self):
+        self._request('DELETE')
+        return True
+
+
+class MilestoneRecord(GithubRecord):
+
+    __slots__ = ('number', 'title')
+
+    def delete(self):
+        self._request('DELETE')
+        return True
+
+
+def make_record(cls, session, url, **fields):
+    record = cls()
+    record.session = session
+    record.url = url
+    for key, value in fields.items():
+        setattr(record, key, value)
+    return record
+
+
+def load_github_graphql(session, github_org, github_repo):
+    """Load open issues, labels, and open milestones over GraphQL.
+
+    All three connections are paged in the same queries, asking only for
+    the fields trolley uses; a connection drops out of the query once its
+    last page has been read.
+    """
+    results = {'issues': [], 'labels': [], 'milestones': []}
+    variables = {
+        'owner': github_org,
+        'name': github_repo,
+        'issues': True,
+        'labels': True,
+        'milestones': True,
+    }
+    while any(variables[name] for name in results):
+        response = session.post(GITHUB_API_URL + '/graphql', data=json.dumps({
+            'query': GITHUB_GRAPHQL_QUERY,
+            'variables': variables,
+        }))
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get('errors'):
+            raise click.ClickException(payload['errors'][0]['message'])
+
+        repository = payload['data']['repository']
+        for name in results:
+            if not variables[name]:
+                continue
+            connection = repository[name]
+            results[name].extend(connection['nodes'])
+            variables[name] = connection['pageInfo']['hasNextPage']
+            variables[name + 'After'] = connection['pageInfo']['endCursor']
+
+    url = '{}/repos/{}/{}'.format(GITHUB_API_URL, github_org, github_repo)
+    issues = [
+        make_record(IssueRecord, session, '{}/issues/{}'.format(url, node['number']),
+                    number=node['number'],
+                    title=node['title'],
+                    body=node['body'],
+                    state=node['state'].lower(),
+                    labels=[label['name'] for label in node['labels']['nodes']],
+                    updated_at=node['updatedAt'])
+        for node in results['issues']]
+    labels = [
+        make_record(LabelRecord, session, '{}/labels/{}'.format(
+                    url, quote(node['name'].encode('utf-8'), safe='')),
+                    name=node['name'],
+                    color=node['color'])
+        for node in results['labels']]
+    milestones = [
+        make_record(MilestoneRecord, session, '{}/milestones/{}'.format(
+                    url, node['number']),
+                    number=node['number'],
+                    title=node['title'])
+        for node in results['milestones']]
+    return issues, labels, milestones
+
+
+class GithubSnapshot(object):
+    """A repository's issues, labels, and milestones loaded once per run.
+
+    Each collection is fetched the first time it is used and is updated in
+    place as items are created, so every helper shares the same view.
+
+    With a SyncState, open issues are also kept on disk and later runs only
+    list issues updated since the previous load (``since=``). With graphql
+    set, all three collections are loaded together by load_github_graphql.
+    """
+
+    def __init__(self, repository, config, state=None, key=None, graphql=False,
+                 fuzzy_threshold=0):
+        self.repository = repository
+        self.config = config
+        self.state = state
+        self.key = key
+        self.graphql = graphql
+        self.fuzzy_threshold = fuzzy_threshold
+        self._issues = None
+        self._labels = None
+        self._milestones = None
+        self._issue_index = None
+        self._label_index = None
+        self._milestone_index = None
+
+    @property
+    def issues(self):
+        if self._issues is None:
+            self._issues = self._load_issues()
+        return self._issues
+
+    def _load_graphql(self):
+        owner, name = self.key.split('/', 1)
+        self._issues, self._labels, self._milestones = load_github_graphql(
+            get_github_session(self.repository), owner, name)
+
+    def _iter_pages(self, path, **params):
+        url = '{}/repos/{}{}'.format(GITHUB_API_URL, self.key, path)
+        return iter_github_pages(self.config, get_github_session(self.repository),
+                                 url, params)
+
+    def iter_issues(self, **params):
+        """List issues straight into IssueRecords, without github3 objects."""
+        for page in self._iter_pages('/issues', **params):
+            for data in page:
+                yield issue_from_dict(data, self.repository)
+
+    def iter_labels(self):
+        session = get_github_session(self.repository)
+        for page in self._iter_pages('/labels'):
+            for data in page:
+                yield make_record(LabelRecord, session, data['url'],
+                                  name=data['name'], color=data['color'])
+
+    def iter_milestones(self, **params):
+        session = get_github_session(self.repository)
+        for page in self._iter_pages('/milestones', **params):
+            for data in page:
+                yield make_record(MilestoneRecord, session, data['url'],
+                                  number=data['number'], title=data['title'])
+
+    def _load_issues(self):
+        if self.graphql:
+            self._load_graphql()
+            return self._issues
+
+        if self.state is None:
+            return list(self.iter_issues())
+
+        scope = 'issues:{}'.format(self.key)
+        started_at = utcnow()
+        since = self.state.last_run(scope)
+        if since is None:
+            issues = list(self.iter_issues())
+            self.state.cache_issues(
+                self.key, [issue_to_dict(item) for item in issues], replace=True)
+        else:
+            changed = self.iter_issues(state='all', since=since)
+            self.state.cache_issues(
+                self.key, [issue_to_dict(item) for item in changed])
+            issues = [issue_from_dict(data, self.repository)
+                      for data in self.state.cached_issues(self.key)]
+        self.state.record_run(scope, started_at)
+        return issues
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            if self.graphql:
+                self._load_graphql()
+            else:
+                self._labels = list(self.iter_labels())
+        return self._labels
+
+    @property
+    def milestones(self):
+        if self._milestones is None:
+            if self.graphql:
+                self._load_graphql()
+            else:
+                self._milestones = list(self.iter_milestones())
+        return self._milestones
+
+    @property
+    def issue_index(self):
+        if self._issue_index is None:
+            self._issue_index = TitleIndex(self.fuzzy_threshold)
+            for item in self.issues:
+                self._issue_index.add(item.title, item.number, item)
+        return self._issue_index
+
+    @property
+    def label_index(self):
+        if self._label_index is None:
+            self._label_index = TitleIndex()
+            for item in self.labels:
+                self._label_index.add(item.name, item.name, item)
+        return self._label_index
+
+    @property
+    def milestone_index(self):
+        if self._milestone_index is None:
+            self._milestone_index = TitleIndex()
+            for item in self.milestones:
+                self._milestone_index.add(item.title, item.number, item)
+        return self._milestone_index
+
+    def get_issue(self, number):
+        """Return an issue by number, fetching it only if not loaded."""
+        if self._issues is not None:
+            issue = self.issue_index.item(number)
+            if issue is not None:
+                return issue
+        response = get_github_session(self.repository).get(
+            '{}/repos/{}/issues/{}'.format(GITHUB_API_URL, self.key, number))
+        response.raise_for_status()
+        return issue_from_dict(response.json(), self.repository)
+
+    def add_issue(self, issue):
+        # keep only the projected fields of issues github3 just created
+        if not isinstance(issue, IssueRecord):
+            issue = issue_from_dict(issue, self.repository)
+        self.issues.append(issue)
+        self.issue_index.add(issue.title, issue.number, issue)
+
+    def remove_issue(self, number):
+        issue = self.issue_index.item(number)
+        if issue is not None:
+            self.issues.remove(issue)
+            self.issue_index.discard(issue.title, number)
+        return issue
+
+    def add_label(self, label):
+        # like issues, labels github3 just created keep only their fields
+        if not isinstance(label, LabelRecord):
+            label = label_from_dict(label, self.repository)
+        self.labels.append(label)
+        self.label_index.add(label.name, label.name, label)
+
+    def remove_label(self, label):
+        self.labels.remove(label)
+        self.label_index.discard(label.name)
+
+    def add_milestone(self, milestone):
+        if not isinstance(milestone, MilestoneRecord):
+            milestone = milestone_from_dict(milestone, self.repository)
+        self.milestones.append(milestone)
+        self.milestone_index.add(milestone.title, milestone.number, milestone)
+
+    def remove_milestone(self, number):
+        if self._milestones is None:
+            return None
+        milestone = self.milestone_index.item(number)
+        if milestone is not None:
+            self._milestones.remove(milestone)
+            self.milestone_index.discard(milestone.title, number)
+        return milestone
+
+
+def get_github_snapshot(config, github_org, github_repo):
+    """Return the shared snapshot for a repository, loading it once."""
+    key = (github_org, github_repo)
+    with _github_snapshots_lock:
+        if key not in _github_snapshots:
+            github = get_github_auth(config.github)
+            repository = github.repository(github_org, github_repo)
+            _github_snapshots[key] = GithubSnapshot(
+                repository,
+                config,
+                state=get_sync_state(config),
+                key='{}/{}'.format(github_org, github_repo),
+                graphql=config.github.graphql,
+                fuzzy_threshold=config.fuzzy_threshold)
+        return _github_snapshots[key]
 
 
 def get_existing_github_issues(config, github_org, github_repo):
-    repository = get_github_repository(config, github_org, github_repo)
-    existing_issues = [str(item.title) for item in repository.iter_issues()]
-    return existing_issues
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    return snapshot.issue_index
+
+
+def find_linked_issue(github_snapshot, link):
+    """Return the issue a sync link points at, or None if it is gone.
+
+    GitHub answers 410 for a deleted issue and 404 for one transferred to
+    a repository we cannot see.
+    """
+    try:
+        return github_snapshot.get_issue(link['issue_number'])
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code not in (404, 410):
+            raise
+        return None
 
 
 def get_existing_github_labels(config, github_org, github_repo):
-    repository = get_github_repository(config, github_org, github_repo)
-    existing_labels = [str(item.name) for item in repository.iter_labels()]
-    return existing_labels
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    return snapshot.label_index
 
 
 def get_existing_github_milestones(config, github_org, github_repo):
-    repository = get_github_repository(config, github_org, github_repo)
-    existing_milestones = [str(item.title) for item in repository.iter_milestones()]
-    return existing_milestones
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    return snapshot.milestone_index
 
 
 # github core
 
 def close_existing_github_issues(config, github_org, github_repo):
-    repository = get_github_repository(config, github_org, github_repo)
-    issues = [str(issue.title) for issue in repository.iter_issues()]
+    step = get_journal(config).step('close_existing_github_issues',
+                                    github_org, github_repo)
+    if step.skip_if_finished():
+        return
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+
+    # list every issue before closing any, since closing them while paging
+    # through open issues would shift later pages and skip issues
+    with profile_phase('fetch'):
+        issues = [issue for issue in snapshot.issues
+                  if not step.is_done(issue.number)]
 
     click.echo('closing {} issues'.format(len(issues)))
-    for issue in repository.iter_issues():
-        click.echo('closing issue "{}"'.format(issue.title))
-        issue.close()
+    tally = Tally('closed', 'issue', total=len(issues))
+    with profile_phase('write'):
+        outcomes = execute(config, 'github', lambda issue: issue.close(), issues)
+        for issue, result, error in outcomes:
+            if error is None:
+                snapshot.remove_issue(issue.number)
+                step.done(issue.number)
+            tally.record(issue.title, error)
+    tally.echo_summary()
+    if not tally.failed:
+        step.finish()
 
 
 def create_github_issues(config, github_org, github_repo,
                          filename='etc/default_github_issues.csv'):
-    issues = csv_to_dict_list(filename)
-    repository = get_github_repository(config, github_org, github_repo)
-    existing_issues = get_existing_github_issues(config, github_org, github_repo)
+    step = get_journal(config).step('create_github_issues',
+                                    github_org, github_repo, filename)
+    if step.skip_if_finished():
+        return
 
-    click.echo('creating {} issues'.format(len(issues)))
-    for issue in issues:
-        title = str(issue['title'])
-        body = str(issue['body'])
-        labels = issue['labels']
+    def load_existing():
+        with profile_phase('fetch'):
+            return get_existing_github_issues(config, github_org, github_repo)
 
-        if labels:
-            if ',' in labels:
-                labels = labels.split(',')
-            else:
-                labels = [labels]
+    def create_issue(item):
+        title, body, labels = item
+        repository = get_github_repository(config, github_org, github_repo)
+        return repository.create_issue(title, body, labels=labels)
 
-        if title not in existing_issues:
-            click.echo('creating issue "{}"'.format(title))
-            repository.create_issue(title, body, labels=labels)
-        else:
-            click.echo('issue "{}" already exists'.format(title))
+    def add_issue(issue):
+        get_github_snapshot(config, github_org, github_repo).add_issue(issue)
+
+    click.echo('creating issues from {}'.format(filename))
+    create_in_batches(config, 'github', 'issue', iter_issue_rows(filename),
+                      load_existing, create_issue, add_issue, step=step)
 
 
 def create_github_labels(config, github_org, github_repo,
                          filename='etc/default_github_labels.csv'):
-    labels = csv_to_dict_list(filename)
-    repository = get_github_repository(config, github_org, github_repo)
+    step = get_journal(config).step('create_github_labels',
+                                    github_org, github_repo, filename)
+    if step.skip_if_finished():
+        return
+    labels = [label for label in csv_to_dict_list(filename)
+              if not step.is_done(normalize_title(label['name']))]
+    if not labels:
+        step.finish()
+        return
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    repository = snapshot.repository
     existing_labels = get_existing_github_labels(config, github_org, github_repo)
+    queued = set()
+    new_labels = []
 
     click.echo('creating {} labels'.format(len(labels)))
     for label in labels:
         name = str(label['name'])
         color = str(label['color'])
-        if name not in existing_labels:
+        if name in existing_labels or normalize_title(name) in queued:
+            click.echo('label "{}" already exists'.format(name))
+            step.done(normalize_title(name))
+        else:
             click.echo('creating label "{}"'.format(name))
             if not len(color):
                 color = get_random_color()
-            repository.create_label(name, color)
-        else:
-            click.echo('label "{}" already exists'.format(name))
+            queued.add(normalize_title(name))
+            new_labels.append((name, color))
+
+    def create_label(item):
+        name, color = item
+        return repository.create_label(name, color)
+
+    tally = Tally('created', 'label')
+    for item, new_label, error in execute(config, 'github', create_label, new_labels):
+        if error is None:
+            snapshot.add_label(new_label)
+            step.done(normalize_title(item[0]))
+        tally.record(item[0], error)
+    tally.echo_summary()
+    if not tally.failed:
+        step.finish()
 
 
 def create_github_milestones(config, github_org, github_repo,
                              filename='etc/default_github_milestones.csv'):
-    milestones = csv_to_dict_list(filename)
-    repository = get_github_repository(config, github_org, github_repo)
+    step = get_journal(config).step('create_github_milestones',
+                                    github_org, github_repo, filename)
+    if step.skip_if_finished():
+        return
+    milestones = [milestone for milestone in csv_to_dict_list(filename)
+                  if not step.is_done(normalize_title(milestone['title']))]
+    if not milestones:
+        step.finish()
+        return
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    repository = snapshot.repository
     existing_milestones = get_existing_github_milestones(config, github_org, github_repo)
 
     click.echo('creating {} milestones'.format(len(milestones)))
@@ -204,30 +1779,62 @@ def create_github_milestones(config, github_org, github_repo,
         title = str(milestone['title'])
         if title not in existing_milestones:
             click.echo('creating milestone "{}"'.format(title))
-            repository.create_milestone(title)
+            new_milestone = repository.create_milestone(title)
+            snapshot.add_milestone(new_milestone)
         else:
             click.echo('milestone "{}" already exists'.format(title))
+        step.done(normalize_title(title))
+    step.finish()
 
 
 def delete_existing_github_labels(config, github_org, github_repo):
-    repository = get_github_repository(config, github_org, github_repo)
+    step = get_journal(config).step('delete_existing_github_labels',
+                                    github_org, github_repo)
+    if step.skip_if_finished():
+        return
+    snapshot = get_github_snapshot(config, github_org, github_repo)
 
-    labels = [str(label.name) for label in repository.iter_labels()]
+    with profile_phase('fetch'):
+        labels = list(snapshot.labels)
 
     click.echo('removing {} labels'.format(len(labels)))
-    for label in labels:
-        click.echo('removing label "{}"'.format(label))
-        repository.label(label).delete()
+    tally = Tally('removed', 'label', total=len(labels))
+    with profile_phase('write'):
+        outcomes = execute(config, 'github', lambda label: label.delete(), labels)
+        for label, result, error in outcomes:
+            if error is None:
+                snapshot.remove_label(label)
+                step.done(label.name)
+            tally.record(label.name, error)
+    tally.echo_summary()
+    if not tally.failed:
+        step.finish()
 
 
 def delete_existing_github_milestones(config, github_org, github_repo):
-    repository = get_github_repository(config, github_org, github_repo)
-    milestones = repository.iter_milestones(github_org, github_repo)
-
-    click.echo('removing {} milestones'.format(len(list(milestones))))
-    for milestone in milestones:
-        click.echo('removing milestone "{}"'.format(milestone.title))
-        milestone.delete()
+    step = get_journal(config).step('delete_existing_github_milestones',
+                                    github_org, github_repo)
+    if step.skip_if_finished():
+        return
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+
+    # the snapshot only holds open milestones, so closed ones are listed here
+    with profile_phase('fetch'):
+        milestones = list(snapshot.iter_milestones(state='all'))
+
+    click.echo('removing {} milestones'.format(len(milestones)))
+    tally = Tally('removed', 'milestone', total=len(milestones))
+    with profile_phase('write'):
+        outcomes = execute(config, 'github', lambda milestone: milestone.delete(),
+                           milestones)
+        for milestone, result, error in outcomes:
+            if error is None:
+                snapshot.remove_milestone(milestone.number)
+                step.done(milestone.number)
+            tally.record(milestone.title, error)
+    tally.echo_summary()
+    if not tally.failed:
+        step.finish()
 
 
 # trello utils
@@ -243,52 +1850,308 @@ def get_trello_auth(trello_config):
     assert trello_config.app_secret
     assert trello_config.auth_token
 
+    from trello import TrelloClient
+
     _trello_auth = TrelloClient(
         api_key=trello_config.app_key,
         api_secret=trello_config.app_secret,
         token=trello_config.auth_token,
         # token_secret=str(trello_config.auth_token),
+        http_service=configure_session(requests.Session(), 'trello',
+                                       trello_config.max_concurrency,
+                                       base_url=trello_config.base_url),
     )
     return _trello_auth
 
 
-def get_existing_trello_boards(config, trello_board_id):
+# the card fields trolley reads, so Trello sends nothing else
+TRELLO_CARD_FIELDS = ('name', 'desc', 'closed', 'idList', 'labels', 'dateLastActivity')
+
+
+class TrelloRecord(object):
+    """Base for the projected Trello objects trolley loads.
+
+    Like GithubRecord, records keep only the fields trolley reads, plus
+    the client needed for the writes made to existing cards.
+    """
+
+    __slots__ = ('client', 'id')
+
+    def _request(self, method, path, value=None):
+        post_args = None if value is None else {'value': value}
+        return self.client.fetch_json(path, http_method=method, post_args=post_args)
+
+
+class CardRecord(TrelloRecord):
+
+    __slots__ = ('name', 'description', 'closed', 'list_id', 'labels',
+                 'date_last_activity')
+
+    def set_name(self, name):
+        self._request('PUT', '/cards/{}/name'.format(self.id), name)
+        self.name = name
+
+    def set_description(self, description):
+        self._request('PUT', '/cards/{}/desc'.format(self.id), description)
+        self.description = description
+
+    def set_closed(self, closed):
+        self._request('PUT', '/cards/{}/closed'.format(self.id), closed)
+        self.closed = closed
+
+    def add_label(self, label):
+        self._request('POST', '/cards/{}/idLabels'.format(self.id), label.id)
+
+    def remove_label(self, label):
+        self._request('DELETE', '/cards/{}/idLabels/{}'.format(self.id, label.id))
+
+
+class TrelloLabelRecord(TrelloRecord):
+
+    __slots__ = ('name', 'color')
+
+
+class ListRecord(TrelloRecord):
+
+    __slots__ = ('name', 'closed')
+
+
+def make_trello_record(cls, client, id, **fields):
+    record = cls()
+    record.client = client
+    record.id = id
+    for key, value in fields.items():
+        setattr(record, key, value)
+    return record
+
+
+def card_from_json(client, data):
+    return make_trello_record(
+        CardRecord, client, data['id'],
+        name=data['name'],
+        description=data.get('desc') or '',
+        closed=data.get('closed', False),
+        list_id=data.get('idList'),
+        labels=[label_from_json(client, label) for label in data.get('labels') or []],
+        date_last_activity=data.get('dateLastActivity'))
+
+
+def label_from_json(client, data):
+    return make_trello_record(TrelloLabelRecord, client, data['id'],
+                              name=data.get('name') or '', color=data.get('color'))
+
+
+def list_from_json(client, data):
+    return make_trello_record(ListRecord, client, data['id'],
+                              name=data['name'], closed=data.get('closed', False))
+
+
+def create_trello_card(client, list_id, name, description, label_ids=()):
+    """Create a card and return it as a CardRecord."""
+    post_args = {
+        'idList': list_id,
+        'name': name,
+        'desc': description,
+    }
+    if label_ids:
+        post_args['idLabels'] = ','.join(label_ids)
+    data = client.fetch_json('/cards', http_method='POST', post_args=post_args)
+    return card_from_json(client, data)
+
+
+def load_trello_cards(client, trello_board_id, filter='open'):
+    """Load a board's cards straight into CardRecords."""
+    cards = client.fetch_json('/boards/{}/cards'.format(trello_board_id), query_params={
+        'filter': filter,
+        'fields': ','.join(TRELLO_CARD_FIELDS),
+    })
+    return [card_from_json(client, data) for data in cards]
+
+
+class TrelloSnapshot(object):
+    """A board's cards, lists, and labels loaded once per run.
+
+    Collections that were not passed in are fetched the first time they
+    are used, and all of them are updated in place as items are created,
+    so every helper shares the same view.
+    """
+
+    def __init__(self, board, cards=None, lists=None, labels=None, fuzzy_threshold=0):
+        self.board = board
+        self._cards = cards
+        self._lists = lists
+        self._labels = labels
+        self.fuzzy_threshold = fuzzy_threshold
+        self._card_index = None
+        self._list_index = None
+        self._label_index = None
+
+    @property
+    def cards(self):
+        if self._cards is None:
+            self._cards = load_trello_cards(self.board.client, self.board.id)
+        return self._cards
+
+    @property
+    def lists(self):
+        if self._lists is None:
+            self._lists = [list_from_json(self.board.client, item) for item in
+                           self.board.client.fetch_json(
+                               '/boards/{}/lists'.format(self.board.id),
+                               query_params={'filter': 'all', 'fields': 'name,closed'})]
+        return self._lists
+
+    @property
+    def labels(self):
+        if self._labels is None:
+            self._labels = [label_from_json(self.board.client, item) for item in
+                            self.board.client.fetch_json(
+                                '/boards/{}/labels'.format(self.board.id),
+                                query_params={'limit': 1000, 'fields': 'name,color'})]
+        return self._labels
+
+    @property
+    def card_index(self):
+        if self._card_index is None:
+            self._card_index = TitleIndex(self.fuzzy_threshold)
+            for item in self.cards:
+                self._card_index.add(item.name, item.id, item)
+        return self._card_index
+
+    @property
+    def list_index(self):
+        if self._list_index is None:
+            self._list_index = TitleIndex()
+            for item in self.lists:
+                self._list_index.add(item.name, item.id, item)
+        return self._list_index
+
+    @property
+    def label_index(self):
+        if self._label_index is None:
+            self._label_index = TitleIndex()
+            for item in self.labels:
+                self._label_index.add(item.name, item.id, item)
+        return self._label_index
+
+    def add_card(self, card):
+        self.cards.append(card)
+        self.card_index.add(card.name, card.id, card)
+
+    def remove_card(self, card_id):
+        card = self.card_index.item(card_id)
+        if card is not None:
+            self.cards.remove(card)
+            self.card_index.discard(card.name, card_id)
+        return card
+
+    def add_list(self, item):
+        # lists and labels py-trello just created keep only their fields
+        if not isinstance(item, ListRecord):
+            item = make_trello_record(ListRecord, self.board.client, item.id,
+                                      name=item.name, closed=item.closed)
+        self.lists.append(item)
+        self.list_index.add(item.name, item.id, item)
+        return item
+
+    def add_label(self, label):
+        if not isinstance(label, TrelloLabelRecord):
+            label = make_trello_record(TrelloLabelRecord, self.board.client, label.id,
+                                       name=label.name, color=label.color)
+        self.labels.append(label)
+        self.label_index.add(label.name, label.id, label)
+        return label
+
+
+def trello_batch(trello, urls):
+    """GET many Trello urls through /1/batch and return their bodies.
+
+    Urls are sent TRELLO_BATCH_LIMIT at a time, the most one batch call
+    accepts, and the bodies come back in the order the urls were given.
+    """
+    results = []
+    for chunk in iter_batches(urls, TRELLO_BATCH_LIMIT):
+        responses = trello.fetch_json('/batch', query_params={
+            'urls': ','.join(chunk),
+        })
+        for url, response in zip(chunk, responses):
+            if '200' not in response:
+                raise click.ClickException(
+                    'Trello batch request for {} failed: {}'.format(url, response))
+            results.append(response['200'])
+    return results
+
+
+def load_trello_snapshots(config, trello_board_ids):
+    """Load several boards' cards, lists, and labels in batched reads.
+
+    Each board needs four GETs (the board and its cards, lists, and
+    labels), so one /1/batch call covers two boards and a single board is
+    loaded in one round trip instead of four.
+    """
+    from trello.board import Board
+
     trello = get_trello_auth(config.trello)
-    board = trello.get_board(trello_board_id)
-    boards = [str(board.name) for board in board.get_cards()]
+    board_ids = [board_id for board_id in trello_board_ids
+                 if board_id not in _trello_snapshots]
+
+    # batch urls are comma separated, so commas inside them are escaped
+    card_fields = '%2C'.join(TRELLO_CARD_FIELDS)
+    urls = []
+    for board_id in board_ids:
+        urls += [
+            '/boards/{}'.format(board_id),
+            '/boards/{}/cards?fields={}'.format(board_id, card_fields),
+            '/boards/{}/lists?filter=all&fields=name%2Cclosed'.format(board_id),
+            '/boards/{}/labels?limit=1000&fields=name%2Ccolor'.format(board_id),
+        ]
+    results = trello_batch(trello, urls)
+
+    for index, board_id in enumerate(board_ids):
+        board_json, cards_json, lists_json, labels_json = results[index * 4:index * 4 + 4]
+        board = Board.from_json(trello_client=trello, json_obj=board_json)
+        _trello_snapshots[board_id] = TrelloSnapshot(
+            board,
+            cards=[card_from_json(trello, item) for item in cards_json],
+            lists=[list_from_json(trello, item) for item in lists_json],
+            labels=[label_from_json(trello, item) for item in labels_json],
+            fuzzy_threshold=config.fuzzy_threshold)
+
+    return [_trello_snapshots[board_id] for board_id in trello_board_ids]
+
+
+def get_trello_snapshot(config, trello_board_id):
+    """Return the shared snapshot for a board, loading it once."""
+    if trello_board_id not in _trello_snapshots:
+        load_trello_snapshots(config, [trello_board_id])
+    return _trello_snapshots[trello_board_id]
+
+
+def get_existing_trello_boards(config, trello_board_id):
+    snapshot = get_trello_snapshot(config, trello_board_id)
+    boards = [str(board.name) for board in snapshot.cards]
     return boards
 
 
 def get_existing_trello_cards(config, trello_board_id):
-    trello = get_trello_auth(config.trello)
-    board = trello.get_board(trello_board_id)
-    cards = board.get_cards()
-    cards = [str(card.name) for card in cards]
-    return cards
+    snapshot = get_trello_snapshot(config, trello_board_id)
+    return snapshot.card_index
 
 
 def get_existing_trello_labels(config, trello_board_id):
-    trello = get_trello_auth(config.trello)
-    board = trello.get_board(trello_board_id)
-    labels = board.get_labels()
-    labels = [label for label in labels]
-    return labels
+    snapshot = get_trello_snapshot(config, trello_board_id)
+    return snapshot.label_index
 
 
 def get_existing_trello_lists(config, trello_board_id):
-    trello = get_trello_auth(config.trello)
-    board = trello.get_board(trello_board_id)
-    all_lists = board.all_lists()
-    all_lists = [item.name for item in all_lists]
-    return all_lists
+    snapshot = get_trello_snapshot(config, trello_board_id)
+    return snapshot.list_index
 
 
 def get_trello_list_lookup(config, trello_board_id):
-    trello = get_trello_auth(config.trello)
-    board = trello.get_board(trello_board_id)
-    all_lists = board.all_lists()
+    snapshot = get_trello_snapshot(config, trello_board_id)
     list_lookup = {}
-    for item in all_lists:
+    for item in snapshot.lists:
         id = item.id
         name = item.name
         list_lookup[name] = id
@@ -296,7 +2159,8 @@ def get_trello_list_lookup(config, trello_board_id):
 
     default_list = config.trello.default_list
     if default_list not in list_lookup:
-        new_list = board.add_list(default_list)
+        new_list = snapshot.board.add_list(default_list)
+        snapshot.add_list(new_list)
         new_list_id = new_list.id
         list_lookup[default_list] = new_list_id
         list_lookup[new_list_id] = default_list
@@ -304,43 +2168,94 @@ def get_trello_list_lookup(config, trello_board_id):
     return list_lookup
 
 
+def compare_content(digest, other_digest, link):
+    """Decide what a one-way sync does with an item found on both sides.
+
+    Returns 'unchanged' when both sides match, 'target_changed' when only
+    the target changed since the last sync (the opposite sync copies it
+    back), 'conflict' when both sides changed, and 'update' otherwise.
+    """
+    if other_digest == digest:
+        return 'unchanged'
+    if link and link['content_hash'] == digest:
+        return 'target_changed'
+    if link and link['content_hash'] != other_digest:
+        return 'conflict'
+    return 'update'
+
+
+def get_sync_action(closed, digest, other_digest, link):
+    """Decide what a one-way sync does with one item.
+
+    other_digest is None when nothing on the other side matches the item.
+    Closed issues and archived cards are then skipped ('skip') and other
+    items are created ('create'); otherwise compare_content() decides.
+    The syncs and the plans built from them share this.
+    """
+    if other_digest is None:
+        return 'skip' if closed else 'create'
+    return compare_content(digest, other_digest, link)
+
+
+def get_trello_card(config, card_id):
+    """Fetch a card missing from the board snapshot, such as an archived one.
+
+    Returns None if the card has been deleted.
+    """
+    from trello.exceptions import ResourceUnavailable
+
+    trello = get_trello_auth(config.trello)
+    try:
+        data = trello.fetch_json('/cards/{}'.format(card_id), query_params={
+            'fields': ','.join(TRELLO_CARD_FIELDS),
+        })
+    except ResourceUnavailable as e:
+        if e._status != 404:
+            raise
+        return None
+    return card_from_json(trello, data)
+
+
+def find_linked_card(config, cards, link):
+    """Return the card a sync link points at, or None if it was deleted."""
+    card = cards.item(link['card_id'])
+    if card is None:
+        with profile_phase('fetch'):
+            card = get_trello_card(config, link['card_id'])
+    return card
+
+
 # trello core
 
 def create_trello_cards(config, trello_board_id,
                         filename='etc/default_trello_cards.csv'):
-    cards = csv_to_dict_list(filename)
-    trello = get_trello_auth(config.trello)
-    existing_cards = get_existing_trello_cards(config, trello_board_id)
-    board_lookup = get_trello_list_lookup(config, trello_board_id)
-    category = board_lookup[config.trello.default_list]
-    board = trello.get_board(trello_board_id)
+    step = get_journal(config).step('create_trello_cards', trello_board_id, filename)
+    if step.skip_if_finished():
+        return
+    loaded = {}
 
-    click.echo('creating {} cards'.format(len(cards)))
+    def load_existing():
+        with profile_phase('fetch'):
+            snapshot = get_trello_snapshot(config, trello_board_id)
+            existing_cards = get_existing_trello_cards(config, trello_board_id)
+            board_lookup = get_trello_list_lookup(config, trello_board_id)
+            loaded['list_id'] = board_lookup[config.trello.default_list]
+            loaded['client'] = snapshot.board.client
+        return existing_cards
 
-    for card in cards:
-        name = str(card.get('title', ''))
-        description = str(card.get('body', ''))
-        labels = card.get('labels', [])
+    def create_card(item):
+        name, description, labels = item
+        # labels are named in the CSV; missing ones are added to the board
+        label_ids = get_trello_label_ids(config, trello_board_id, labels) if labels else []
+        return create_trello_card(loaded['client'], loaded['list_id'], name,
+                                  description, label_ids)
 
-        if labels:
-            if ',' in labels:
-                labels = labels.split(',')
-            else:
-                labels = [labels]
-
-        if name not in existing_cards:
-            click.echo('creating issue "{}"'.format(name))
-            list_item = board.get_list(category)
-            new_card = list_item.add_card(name, description, labels=labels)
-
-            '''
-            # currently labels are broken in the trello python client :/
-            if len(labels):
-                for label in labels:
-                    trello.cards.new_label(new_card['id'], label)
-            '''
-        else:
-            click.echo('issue "{}" already exists'.format(name))
+    def add_card(card):
+        get_trello_snapshot(config, trello_board_id).add_card(card)
+
+    click.echo('creating cards from {}'.format(filename))
+    create_in_batches(config, 'trello', 'card', iter_issue_rows(filename),
+                      load_existing, create_card, add_card, step=step)
 
 
 def create_trello_labels(config, trello_board_id,
@@ -364,8 +2279,15 @@ def create_trello_labels(config, trello_board_id,
 
 def create_trello_lists(config, trello_board_id,
                         filename='etc/default_trello_lists.csv'):
-    lists = csv_to_dict_list(filename)
-    trello = get_trello_auth(config.trello)
+    step = get_journal(config).step('create_trello_lists', trello_board_id, filename)
+    if step.skip_if_finished():
+        return
+    lists = [item for item in csv_to_dict_list(filename)
+             if not step.is_done(normalize_title(item['title']))]
+    if not lists:
+        step.finish()
+        return
+    snapshot = get_trello_snapshot(config, trello_board_id)
     existing_lists = get_existing_trello_lists(config, trello_board_id)
 
     click.echo('creating {} lists'.format(len(lists)))
@@ -374,9 +2296,12 @@ def create_trello_lists(config, trello_board_id,
         title = str(item['title'])
         if title not in existing_lists:
             click.echo('creating list "{}"'.format(title))
-            trello.boards.new_list(trello_board_id, title)
+            new_list = snapshot.board.add_list(title)
+            snapshot.add_list(new_list)
         else:
             click.echo('list "{}" already exists'.format(title))
+        step.done(normalize_title(title))
+    step.finish()
 
 
 def list_trello_boards(config):
@@ -400,56 +2325,469 @@ def list_trello_organizations(config):
         ))
 
 
+# sync state
+
+class SyncState(object):
+    """Local SQLite record of linked GitHub issues and Trello cards.
+
+    Each link keeps both ids, the ``updated_at`` each side had when it was
+    last synced, and a hash of the synced content, so later runs can skip
+    items that have not changed and follow items that were renamed.
+    """
+
+    def __init__(self, filename):
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS links (
+                    github_repo TEXT NOT NULL,
+                    issue_number INTEGER NOT NULL,
+                    trello_board TEXT NOT NULL,
+                    card_id TEXT NOT NULL,
+                    issue_updated_at TEXT,
+                    card_updated_at TEXT,
+                    content_hash TEXT,
+                    PRIMARY KEY (github_repo, issue_number, trello_board)
+                )""")
+            self.connection.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS links_by_card
+                ON links (trello_board, card_id, github_repo)""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    scope TEXT PRIMARY KEY,
+                    started_at TEXT NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS issues (
+                    github_repo TEXT NOT NULL,
+                    number INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (github_repo, number)
+                )""")
+
+    def links(self, github_repo, trello_board):
+        """Return every link between a repository and a board."""
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT * FROM links WHERE github_repo = ? AND trello_board = ?',
+                (github_repo, trello_board)).fetchall()
+        return [dict(row) for row in rows]
+
+    def link(self, github_repo, issue_number, trello_board, card_id,
+             issue_updated_at=None, card_updated_at=None, content_hash=None):
+        """Record (or refresh) the link between an issue and a card."""
+        with self._lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM links WHERE trello_board = ? AND card_id = ? '
+                'AND github_repo = ?', (trello_board, card_id, github_repo))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (github_repo, issue_number, trello_board, card_id,
+                 issue_updated_at, card_updated_at, content_hash))
+
+    def forget_issue(self, github_repo, issue_number):
+        """Drop the links and cached copy of a deleted or transferred issue."""
+        with self._lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM links WHERE github_repo = ? AND issue_number = ?',
+                (github_repo, issue_number))
+            self.connection.execute(
+                'DELETE FROM issues WHERE github_repo = ? AND number = ?',
+                (github_repo, issue_number))
+
+    def last_run(self, scope):
+        """Return when the last successful run of scope started."""
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT started_at FROM runs WHERE scope = ?', (scope,)).fetchone()
+        return row['started_at'] if row else None
+
+    def record_run(self, scope, started_at):
+        with self._lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?)', (scope, started_at))
+
+    def cached_issues(self, github_repo):
+        """Return the stored JSON of a repository's open issues."""
+        with self._lock:
+            rows = self.connection.execute(
+                'SELECT data FROM issues WHERE github_repo = ? '
+                'ORDER BY number DESC', (github_repo,)).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def cache_issues(self, github_repo, issues, replace=False):
+        """Store open issues and drop the ones that have been closed."""
+        with self._lock, self.connection:
+            if replace:
+                self.connection.execute(
+                    'DELETE FROM issues WHERE github_repo = ?', (github_repo,))
+            for data in issues:
+                if data.get('state') == 'open':
+                    self.connection.execute(
+                        'INSERT OR REPLACE INTO issues VALUES (?, ?, ?)',
+                        (github_repo, data['number'], json.dumps(data)))
+                else:
+                    self.connection.execute(
+                        'DELETE FROM issues WHERE github_repo = ? AND number = ?',
+                        (github_repo, data['number']))
+
+
+def get_sync_state(config):
+    """Open the sync state store once and return it."""
+    global _sync_state
+
+    if _sync_state is None:
+        _sync_state = SyncState(config.state_file)
+    return _sync_state
+
+
+def content_hash(title, body, labels=(), closed=False):
+    """Return a stable hash of the content that sync copies across.
+
+    Labels are compared by name, ignoring their order and case.
+    """
+    names = sorted(set(normalize_title(label) for label in labels if label))
+    content = json.dumps([normalize_title(title), (body or '').strip(),
+                          names, bool(closed)])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def issue_labels(issue):
+    """Return the label names of a github3 issue or an IssueRecord."""
+    # github3 1.x keeps the issue's labels in original_labels
+    labels = getattr(issue, 'original_labels', None)
+    if labels is None:
+        labels = issue.labels
+    return [getattr(label, 'name', label) for label in labels or []]
+
+
+def issue_content_hash(issue):
+    return content_hash(issue.title, issue.body, issue_labels(issue),
+                        issue.state == 'closed')
+
+
+def card_content_hash(card):
+    return content_hash(card.name, card.description,
+                        [label.name for label in card.labels or []],
+                        card.closed)
+
+
+def copy_issue_to_card(snapshot, issue, card):
+    """Make a card match an issue, writing only the fields that differ."""
+    body = issue.body or ''
+    if card.name != issue.title:
+        card.set_name(issue.title)
+    if (card.description or '') != body:
+        card.set_description(body)
+
+    wanted = dict((normalize_title(name), name) for name in issue_labels(issue))
+    labels = []
+    for label in card.labels or []:
+        if normalize_title(label.name) in wanted:
+            labels.append(label)
+        else:
+            card.remove_label(label)
+    current = set(normalize_title(label.name) for label in labels)
+    for key, name in wanted.items():
+        if key in current:
+            continue
+        label = snapshot.label_index.get(name)
+        if label is None:
+            label = snapshot.add_label(snapshot.board.add_label(name, None))
+        card.add_label(label)
+        labels.append(label)
+    card.labels = labels
+
+    closed = issue.state == 'closed'
+    if bool(card.closed) != closed:
+        card.set_closed(closed)
+
+
+def copy_card_to_issue(card, issue):
+    """Make an issue match a card in a single edit."""
+    issue.edit(title=card.name,
+               body=card.description or '',
+               state='closed' if card.closed else 'open',
+               labels=[label.name for label in card.labels or []])
+
+
+def utcnow():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def get_card_updated_at(card):
+    updated_at = (getattr(card, 'date_last_activity', None) or
+                  getattr(card, 'dateLastActivity', None))
+    return str(updated_at) if updated_at else None
+
+
 # sync github and trello
 
 def sync_github_issues_to_trello_cards(config, github_org, github_repo,
                                        trello_board_id):
-    trello = get_trello_auth(config.trello)
-    board_lookup = get_trello_list_lookup(config, trello_board_id)
-    existing_trello_cards = get_existing_trello_cards(config, trello_board_id)
-    repository = get_github_repository(config, github_org, github_repo)
-    issues = repository.iter_issues()
+    state = get_sync_state(config)
+    repo_key = '{}/{}'.format(github_org, github_repo)
+    scope = 'github:{}->trello:{}'.format(repo_key, trello_board_id)
+    started_at = utcnow()
+    since = state.last_run(scope)
+
+    with profile_phase('fetch'):
+        # the board loads while GitHub is being listed
+        trello_load = get_page_pool(config).apply_async(
+            get_trello_snapshot, (config, trello_board_id))
+        github_snapshot = get_github_snapshot(config, github_org, github_repo)
+        links = dict((link['issue_number'], link)
+                     for link in state.links(repo_key, trello_board_id))
+
+        # only issues changed since the last run need to be looked at, and
+        # closed ones are included so closing an issue archives its card.
+        # They are diffed as their pages arrive, with later pages in flight.
+        if since:
+            issues = github_snapshot.iter_issues(state='all', since=since)
+        else:
+            issues = github_snapshot.issues
+
+        snapshot = trello_load.get()
+        board_lookup = get_trello_list_lookup(config, trello_board_id)
+        existing_trello_cards = get_existing_trello_cards(config, trello_board_id)
+        list_id = board_lookup[config.trello.default_list]
+
+    with profile_phase('diff'):
+        for issue in issues:
+            title = issue.title
+            updated_at = str(issue.updated_at)
+            digest = issue_content_hash(issue)
+            link = links.get(issue.number)
+
+            if link and link['issue_updated_at'] == updated_at:
+                continue
+
+            if link:
+                card = find_linked_card(config, existing_trello_cards, link)
+                if card is None:
+                    click.echo('card for issue "{}" was deleted'.format(title))
+                    continue
+            else:
+                card = existing_trello_cards.find(title)
+
+            action = get_sync_action(issue.state == 'closed', digest,
+                                     None if card is None else card_content_hash(card),
+                                     link)
+            if action == 'skip':
+                continue
+            if action == 'create':
+                click.echo('creating issue "{}"'.format(title))
+                with profile_phase('write'):
+                    card = create_trello_card(snapshot.board.client, list_id,
+                                              title, issue.body or '')
+                    copy_issue_to_card(snapshot, issue, card)
+                snapshot.add_card(card)
+            elif action == 'unchanged':
+                click.echo('issue "{}" is unchanged'.format(title))
+            elif action == 'target_changed':
+                # the trello to github sync copies the card back
+                click.echo('card for issue "{}" changed on Trello'.format(title))
+                continue
+            else:
+                if action == 'conflict':
+                    click.echo('issue "{}" changed on both sides, '
+                               'keeping GitHub\'s'.format(title))
+                click.echo('updating issue "{}"'.format(title))
+                with profile_phase('write'):
+                    copy_issue_to_card(snapshot, issue, card)
 
-    #click.echo('creating {} issues'.format(issues.count))
+            state.link(repo_key, issue.number, trello_board_id, card.id,
+                       issue_updated_at=updated_at,
+                       card_updated_at=get_card_updated_at(card),
+                       content_hash=digest)
 
-    for issue in issues:
-        title = issue.title
-        desc = issue.body
-        category = board_lookup[config.trello.default_list]
-        if title not in existing_trello_cards:
-            click.echo('creating issue "{}"'.format(title))
-            trello.cards.new(title, category, desc=desc)
-        else:
-            click.echo('issue "{}" already exists'.format(title))
+    state.record_run(scope, started_at)
 
 
 def sync_trello_cards_to_github_issues(config, trello_board_id, github_org, github_repo):
-    trello = get_trello_auth(config.trello)
-    existing_github_issues = get_existing_github_issues(config, github_org, github_repo)
-    repository = get_github_repository(config, github_org, github_repo)
-    board = trello.get_board(trello_board_id)
-    cards = board.all_cards()
+    state = get_sync_state(config)
+    repo_key = '{}/{}'.format(github_org, github_repo)
+    with profile_phase('fetch'):
+        github_snapshot = get_github_snapshot(config, github_org, github_repo)
+        repository = github_snapshot.repository
+        board = get_trello_snapshot(config, trello_board_id).board
+        links = dict((link['card_id'], link)
+                     for link in state.links(repo_key, trello_board_id))
+        cards = load_trello_cards(board.client, trello_board_id, filter='all')
 
     click.echo('creating {} cards'.format(len(cards)))
-    for card in cards:
-        name = card.name
-        # id = card['id']
-        # list_id = card['idList']
-        description = card.description
-        labels = card.labels
+    with profile_phase('diff'):
+        for card in cards:
+            name = card.name
+            # id = card['id']
+            # list_id = card['idList']
+            description = card.description or ''
+            labels = [label.name for label in card.labels or []]
+            updated_at = get_card_updated_at(card)
+            digest = card_content_hash(card)
+            link = links.get(card.id)
+
+            if link and updated_at and link['card_updated_at'] == updated_at:
+                continue
+
+            if link:
+                with profile_phase('fetch'):
+                    issue = find_linked_issue(github_snapshot, link)
+                if issue is None:
+                    click.echo('issue for card "{}" was deleted'.format(name))
+                    state.forget_issue(repo_key, link['issue_number'])
+                    continue
+            else:
+                # the full issue list is only loaded for cards not linked yet
+                with profile_phase('fetch'):
+                    existing_issues = get_existing_github_issues(
+                        config, github_org, github_repo)
+                issue = existing_issues.find(name)
+
+            action = get_sync_action(card.closed, digest,
+                                     None if issue is None else issue_content_hash(issue),
+                                     link)
+            if action == 'skip':
+                continue
+            if action == 'create':
+                click.echo('creating card "{}"'.format(name))
+                with profile_phase('write'):
+                    issue = repository.create_issue(name, description, labels=labels)
+                github_snapshot.add_issue(issue)
+            elif action == 'unchanged':
+                click.echo('card "{}" is unchanged'.format(name))
+            elif action == 'target_changed':
+                # the github to trello sync copies the issue back
+                click.echo('issue for card "{}" changed on GitHub'.format(name))
+                continue
+            else:
+                if action == 'conflict':
+                    click.echo('card "{}" changed on both sides, '
+                               'keeping Trello\'s'.format(name))
+                click.echo('updating card "{}"'.format(name))
+                with profile_phase('write'):
+                    copy_card_to_issue(card, issue)
 
-        if name not in existing_github_issues:
-            click.echo('creating card "{}"'.format(name))
-            repository.create_issue(name, description, labels=labels)
+            state.link(repo_key, issue.number, trello_board_id, card.id,
+                       issue_updated_at=str(issue.updated_at),
+                       card_updated_at=updated_at,
+                       content_hash=digest)
 
-        else:
-            click.echo('card "{}" already exists'.format(name))
+
+def get_async_engine():
+    """Import the asyncio sync engine, which needs Python 3 and aiohttp."""
+    try:
+        import trolley_async
+    except (ImportError, SyntaxError) as e:
+        raise click.ClickException(
+            '--engine async needs Python 3.7+ and aiohttp: {}'.format(e))
+    return trolley_async
+
+
+def get_projects(config, filename=None):
+    """Return the (github_org, github_repo, trello_board_id) pairs to sync.
+
+    Pairs come from the projects section of the config file, where each
+    entry has a ``github`` ``org/repo`` and a ``trello`` board id, and from
+    a CSV with github_org, github_repo and trello_board_id columns.
+    """
+    projects = []
+    for pair in config.projects.pairs or []:
+        github_org, github_repo = pair['github'].split('/', 1)
+        projects.append((github_org, github_repo, pair['trello']))
+
+    filename = filename or config.projects.filename
+    if filename:
+        for row in iter_csv_rows(filename):
+            projects.append((row['github_org'], row['github_repo'],
+                             row['trello_board_id']))
+
+    seen = set()
+    return [project for project in projects
+            if not (project in seen or seen.add(project))]
+
+
+def group_projects(projects):
+    """Split pairs into groups that share no repo and no board.
+
+    Pairs are joined when they share a repo or a board, and through those
+    into chains, so each group can be synced by one worker without racing
+    another on a snapshot.
+    """
+    parents = {}
+
+    def find(node):
+        while parents.setdefault(node, node) != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    for github_org, github_repo, trello_board_id in projects:
+        parents[find(('github', github_org, github_repo))] = find(
+            ('trello', trello_board_id))
+
+    groups = collections.OrderedDict()
+    for project in projects:
+        groups.setdefault(find(('trello', project[2])), []).append(project)
+    return list(groups.values())
+
+
+def sync_all(config, projects, direction='both', workers=None):
+    """Sync many repo and board pairs from one process.
+
+    Every pair shares the same API sessions, rate governors and sync
+    state, and all boards are loaded up front in batched Trello reads.
+    Pairs that share a repo or a board run one after another in the same
+    worker, since they share its snapshot. Returns the Tally of pairs.
+    """
+    if config.engine == 'async':
+        return get_async_engine().sync_all(config, projects, direction=direction)
+
+    # create the shared clients before any worker threads race to
+    get_github_auth(config.github)
+    get_trello_auth(config.trello)
+    get_sync_state(config)
+
+    with profile_phase('fetch'):
+        load_trello_snapshots(config, sorted(set(board for _, _, board in projects)))
+
+    def sync_group(group):
+        outcomes = []
+        for github_org, github_repo, trello_board_id in group:
+            started = time.time()
+            try:
+                if direction in ('both', 'github'):
+                    sync_github_issues_to_trello_cards(
+                        config, github_org, github_repo, trello_board_id)
+                if direction in ('both', 'trello'):
+                    sync_trello_cards_to_github_issues(
+                        config, trello_board_id, github_org, github_repo)
+                error = None
+            except Exception as e:
+                error = e
+            name = '{}/{} <-> {} in {:.1f}s'.format(
+                github_org, github_repo, trello_board_id, time.time() - started)
+            outcomes.append((name, error))
+        return outcomes
+
+    tally = Tally('synced', 'project')
+    pool = ThreadPool(max(workers or config.concurrency, 1))
+    try:
+        for outcomes in pool.imap_unordered(sync_group, group_projects(projects)):
+            for name, error in outcomes:
+                tally.record(name, error)
+    finally:
+        pool.close()
+        pool.join()
+    tally.echo_summary()
+    return tally
 
 
 def list_trello_cards(config, trello_board_id):
-    trello = get_trello_auth(config.trello)
-    board = trello.get_board(config.trello.board_id)
-    cards = [card for card in board.open_cards()]
+    snapshot = get_trello_snapshot(config, trello_board_id)
+    cards = snapshot.cards
 
     for card in cards:
         name = card.name
@@ -471,16 +2809,21 @@ def get_buffer_auth(buffer_config):
     assert buffer_config.client_secret
     assert buffer_config.access_token
 
+    from buffpy.api import API as BufferAPI
+
     _buffer_auth = BufferAPI(
         client_id=buffer_config.client_id,
         client_secret=buffer_config.client_secret,
         access_token=buffer_config.access_token,
     )
+    configure_session(_buffer_auth.session, 'buffer', buffer_config.max_concurrency)
 
     return _buffer_auth
 
 
 def test_buffer(config):
+    from buffpy.managers.profiles import Profiles
+
     client = get_buffer_auth(config.buffer)
 
     profiles = Profiles(api=client).filter(service='twitter')
@@ -488,15 +2831,923 @@ def test_buffer(config):
         raise Exception('Your twitter account is not configured')
 
     profile = profiles[0]
-    print profile
-    print
+    click.echo(profile)
+    click.echo()
     pending = profile.updates.pending
     for item in pending:
-        print item
-        print item.id
-        print item.text
-        print item.scheduled_at
-        print datetime.datetime.fromtimestamp(item.scheduled_at)
+        click.echo(item)
+        click.echo(item.id)
+        click.echo(item.text)
+        click.echo(item.scheduled_at)
+        click.echo(datetime.datetime.fromtimestamp(item.scheduled_at))
+
+
+# pending updates are listed this many at a time, the most Buffer allows
+BUFFER_PAGE_SIZE = 100
+
+
+def get_buffer_profiles(config, service=None):
+    from buffpy.managers.profiles import Profiles
+
+    client = get_buffer_auth(config.buffer)
+    profiles = Profiles(api=client)
+    profiles = profiles.filter(service=service) if service else profiles.all()
+    if not len(profiles):
+        raise click.ClickException('No {}Buffer profiles are configured'.format(
+            service + ' ' if service else ''))
+    return profiles
+
+
+def get_buffer_profile_names(profile):
+    """Return the names a CSV row can use to pick a profile."""
+    username = profile.get('formatted_username') or ''
+    return set(str(name).lower() for name in (
+        profile.get('id'), profile.get('service'), username, username.lstrip('@'))
+        if name)
+
+
+def load_buffer_pending(config, profiles):
+    """Return every profile's pending updates as {profile id: [update]}.
+
+    The first page of every profile is fetched at once. Its total says how
+    many pages are left, and those are then fetched together.
+    """
+    client = get_buffer_auth(config.buffer)
+
+    def fetch(item):
+        profile_id, page = item
+        return profile_id, client.get(
+            url='profiles/{}/updates/pending.json?count={}&page={}'.format(
+                profile_id, BUFFER_PAGE_SIZE, page))
+
+    pending = {}
+    pages = []
+    for profile_id, data in prefetch(config, fetch, [(profile.id, 1) for profile in profiles]):
+        pending[profile_id] = list(data.get('updates') or [])
+        count = (int(data.get('total') or 0) + BUFFER_PAGE_SIZE - 1) // BUFFER_PAGE_SIZE
+        pages += [(profile_id, page) for page in range(2, count + 1)]
+    for profile_id, data in prefetch(config, fetch, pages):
+        pending[profile_id].extend(data.get('updates') or [])
+    return pending
+
+
+def get_buffer_update_key(profile_id, text):
+    """Return the key a post is deduped by: its text on one profile."""
+    return '{} {}'.format(profile_id, text)
+
+
+def iter_buffer_rows(filename, profiles):
+    """Yield (text, profile, scheduled_at) for each valid row of a posts CSV.
+
+    Rows are handed to profiles in turn. A ``profile`` column limits a row
+    to the profiles with that id, service, or username.
+    """
+    turn = itertools.count()
+    for line, row in enumerate(iter_csv_rows(filename), 2):
+        text = str(row.get('text') or '').strip()
+        if not text:
+            click.echo('skipping line {}: missing text'.format(line), err=True)
+            continue
+        wanted = str(row.get('profile') or '').strip().lower()
+        candidates = [profile for profile in profiles
+                      if not wanted or wanted in get_buffer_profile_names(profile)]
+        if not candidates:
+            click.echo('skipping line {}: no profile "{}"'.format(line, wanted), err=True)
+            continue
+        profile = candidates[next(turn) % len(candidates)]
+        yield text, profile, row.get('scheduled_at') or None
+
+
+def schedule_buffer_updates(config, filename, service=None):
+    """Queue each post in a CSV on one of the Buffer profiles.
+
+    A post whose text is already pending on the profile its row goes to is
+    skipped, so running the same file again does not queue it twice. The
+    same text may still be queued on several profiles.
+    """
+    step = get_journal(config).step('schedule_buffer_updates', filename, service or '')
+    if step.skip_if_finished():
+        return
+    profiles = get_buffer_profiles(config, service)
+    loaded = {}
+
+    def load_existing():
+        with profile_phase('fetch'):
+            existing = TextIndex()
+            for profile_id, updates in load_buffer_pending(config, profiles).items():
+                for update in updates:
+                    existing.add(get_buffer_update_key(profile_id, update.get('text') or ''),
+                                 update.get('id'))
+        loaded['existing'] = existing
+        return existing
+
+    def create_update(item):
+        text, profile, scheduled_at = item
+        return text, profile, profile.updates.new(text, when=scheduled_at)
+
+    def add_update(result):
+        text, profile, update = result
+        loaded['existing'].add(get_buffer_update_key(profile.id, text), update.get('id'))
+
+    def get_row_key(row):
+        text, profile, _ = row
+        return get_buffer_update_key(profile.id, text)
+
+    click.echo('scheduling updates from {}'.format(filename))
+    create_in_batches(config, 'buffer', 'update', iter_buffer_rows(filename, profiles),
+                      load_existing, create_update, add_update, step=step,
+                      key=get_row_key)
+
+
+def list_buffer_updates(config, service=None):
+    profiles = get_buffer_profiles(config, service)
+    pending = load_buffer_pending(config, profiles)
+
+    for profile in profiles:
+        updates = pending[profile.id]
+        click.echo('{} {} ({}): {} pending'.format(
+            profile.get('service'), profile.get('formatted_username'), profile.id,
+            len(updates)))
+        for update in updates:
+            scheduled_at = update.get('scheduled_at')
+            if scheduled_at:
+                scheduled_at = datetime.datetime.fromtimestamp(scheduled_at)
+            click.echo('  {} {} {}'.format(update.get('id'), scheduled_at, update.get('text')))
+
+
+# export
+
+# the columns etc/default_github_issues.csv and default_trello_cards.csv use
+EXPORT_FIELDS = ('title', 'body', 'labels')
+
+GITHUB_EXPORT_FIELDS = EXPORT_FIELDS + ('number', 'state', 'updated_at', 'url')
+TRELLO_EXPORT_FIELDS = EXPORT_FIELDS + ('id', 'state', 'list_id', 'updated_at', 'url')
+
+
+def get_export_fields(fields, available):
+    """Turn a --fields value ("title,labels") into a tuple of field names."""
+    if not fields:
+        return EXPORT_FIELDS
+    fields = tuple(field.strip() for field in fields.split(',') if field.strip())
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise click.ClickException('unknown export fields {}, choose from {}'.format(
+            ', '.join(unknown), ', '.join(available)))
+    return fields
+
+
+def open_export(filename, compress=False):
+    """Open an export file for writing text, gzipped if asked to."""
+    if filename == '-':
+        if compress:
+            raise click.ClickException('--gzip needs a filename, not stdout')
+        return click.get_text_stream('stdout')
+    if compress:
+        return gzip.open(filename, 'wt')
+    return open(filename, 'w')
+
+
+def write_export(rows, filename, format='csv', fields=EXPORT_FIELDS, compress=False):
+    """Write each row dict's fields to a CSV or JSONL file as it arrives.
+
+    Labels are joined with commas in a CSV, like the importers expect, and
+    kept as a list in JSONL. Returns the number of rows written.
+    """
+    f = open_export(filename, compress)
+    count = 0
+    try:
+        if format == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(fields)
+        for row in rows:
+            values = [row.get(field) for field in fields]
+            if format == 'csv':
+                writer.writerow([
+                    ','.join(value) if isinstance(value, list) else
+                    '' if value is None else value
+                    for value in values])
+            else:
+                f.write(json.dumps(dict(zip(fields, values)), sort_keys=True))
+                f.write('\n')
+            count += 1
+    finally:
+        if filename != '-':
+            f.close()
+    return count
+
+
+def iter_github_export_rows(config, github_org, github_repo, state='open'):
+    """Yield each issue as an export row, a page at a time.
+
+    Pull requests are left out so an export can be fed back to
+    create_github_issues.
+    """
+    repository = get_github_snapshot(config, github_org, github_repo).repository
+    url = '{}/repos/{}/{}/issues'.format(GITHUB_API_URL, github_org, github_repo)
+    for page in iter_github_pages(config, get_github_session(repository), url,
+                                  {'state': state}):
+        for data in page:
+            if 'pull_request' in data:
+                continue
+            row = issue_to_dict(data)
+            row['url'] = data.get('html_url') or row['url']
+            yield row
+
+
+def iter_trello_export_rows(config, trello_board_id, state='open'):
+    """Yield each card as an export row, one list at a time.
+
+    Trello returns a list's cards in one response, so only the lists
+    being fetched ahead are ever held in memory, never the whole board.
+    """
+    trello = get_trello_auth(config.trello)
+    lists = trello.fetch_json('/boards/{}/lists'.format(trello_board_id), query_params={
+        'filter': 'open' if state == 'open' else 'all',
+        'fields': 'name',
+    })
+
+    def fetch_cards(item):
+        return trello.fetch_json('/lists/{}/cards'.format(item['id']), query_params={
+            'filter': state,
+            'fields': ','.join(TRELLO_CARD_FIELDS + ('url',)),
+        })
+
+    for cards in prefetch(config, fetch_cards, lists):
+        for data in cards:
+            yield {
+                'title': data['name'],
+                'body': data.get('desc') or '',
+                'labels': [label.get('name') or '' for label in data.get('labels') or []],
+                'id': data['id'],
+                'state': 'closed' if data.get('closed') else 'open',
+                'list_id': data.get('idList'),
+                'updated_at': data.get('dateLastActivity'),
+                'url': data.get('url'),
+            }
+
+
+def export_github_issues(config, github_org, github_repo, filename,
+                         format='csv', fields=None, state='open', compress=False):
+    fields = get_export_fields(fields, GITHUB_EXPORT_FIELDS)
+    rows = iter_github_export_rows(config, github_org, github_repo, state)
+    with profile_phase('write'):
+        count = write_export(rows, filename, format, fields, compress)
+    click.echo('exported {} issues'.format(count), err=True)
+    return count
+
+
+def export_trello_cards(config, trello_board_id, filename,
+                        format='csv', fields=None, state='open', compress=False):
+    fields = get_export_fields(fields, TRELLO_EXPORT_FIELDS)
+    rows = iter_trello_export_rows(config, trello_board_id, state)
+    with profile_phase('write'):
+        count = write_export(rows, filename, format, fields, compress)
+    click.echo('exported {} cards'.format(count), err=True)
+    return count
+
+
+# near matches
+
+def report_near_matches(config, github_org, github_repo, trello_board_id):
+    """Echo each issue whose title only nearly matches a card's, and why.
+
+    Returns the number of near matches found.
+    """
+    threshold = config.fuzzy_threshold or TROLLEY_FUZZY_THRESHOLD
+    with profile_phase('fetch'):
+        issues = get_github_snapshot(config, github_org, github_repo).issues
+        cards = get_trello_snapshot(config, trello_board_id).cards
+
+    with profile_phase('diff'):
+        exact = TitleIndex()
+        fuzzy = FuzzyIndex(threshold)
+        for card in cards:
+            exact.add(card.name, card.id, card)
+            fuzzy.add(card.name, card.id)
+
+        found = 0
+        for issue in issues:
+            if issue.title in exact:
+                continue
+            for card_id, name, score in fuzzy.matches(issue.title):
+                click.echo('#{} "{}" ~ card {} "{}" ({:.0%} similar)'.format(
+                    issue.number, issue.title, card_id, name, score))
+                found += 1
+
+    click.echo('found {} near matches at {:.0%} similarity or more'.format(found, threshold))
+    return found
+
+
+# watch
+
+# issue events that change what a card shows; others, such as assigned or
+# pinned, are ignored, and deleted or transferred issues are unlinked
+WATCH_ISSUE_ACTIONS = ('opened', 'edited', 'closed', 'reopened', 'labeled',
+                       'unlabeled')
+
+
+class Watcher(object):
+    """Apply GitHub issue and Trello card webhooks to the other side.
+
+    The repository and board snapshots stay in memory and only the item
+    named in each event is touched. Events are applied one at a time by
+    the thread that calls run(), and a full reconcile() of both sync
+    directions is queued every reconcile_interval seconds as a fallback
+    for missed deliveries.
+    """
+
+    def __init__(self, config, github_org, github_repo, trello_board_id,
+                 reconcile_interval=900):
+        self.config = config
+        self.github_org = github_org
+        self.github_repo = github_repo
+        self.trello_board_id = trello_board_id
+        self.repo_key = '{}/{}'.format(github_org, github_repo)
+        self.reconcile_interval = reconcile_interval
+        self.state = get_sync_state(config)
+        self.events = Queue()
+        self.load()
+
+    def load(self):
+        config = self.config
+        self.github = get_github_snapshot(config, self.github_org, self.github_repo)
+        self.trello = get_trello_snapshot(config, self.trello_board_id)
+        self.issues = get_existing_github_issues(config, self.github_org, self.github_repo)
+        self.cards = get_existing_trello_cards(config, self.trello_board_id)
+        board_lookup = get_trello_list_lookup(config, self.trello_board_id)
+        self.list_id = board_lookup[config.trello.default_list]
+        links = self.state.links(self.repo_key, self.trello_board_id)
+        self.links_by_issue = dict((link['issue_number'], link) for link in links)
+        self.links_by_card = dict((link['card_id'], link) for link in links)
+
+    def link(self, issue, card, digest):
+        self.state.link(self.repo_key, issue.number, self.trello_board_id, card.id,
+                        issue_updated_at=str(issue.updated_at),
+                        card_updated_at=get_card_updated_at(card),
+                        content_hash=digest)
+        link = {'issue_number': issue.number, 'card_id': card.id, 'content_hash': digest}
+        self.links_by_issue[issue.number] = link
+        self.links_by_card[card.id] = link
+
+    def unlink_issue(self, number, title, reason):
+        """Forget an issue that left the repository and archive its card."""
+        self.github.remove_issue(number)
+        self.state.forget_issue(self.repo_key, number)
+        link = self.links_by_issue.pop(number, None)
+        if link is None:
+            return
+        self.links_by_card.pop(link['card_id'], None)
+        card = self.cards.item(link['card_id'])
+        if card is not None:
+            click.echo('archiving card for {} issue "{}"'.format(reason, title))
+            self.trello.remove_card(card.id)
+            card.set_closed(True)
+
+    def on_github(self, event, payload):
+        if event != 'issues' or 'pull_request' in payload.get('issue', {}):
+            return
+        action = payload.get('action')
+        if action in ('deleted', 'transferred'):
+            self.unlink_issue(payload['issue']['number'], payload['issue']['title'],
+                              action)
+            return
+        if action not in WATCH_ISSUE_ACTIONS:
+            return
+        issue = issue_from_dict(payload['issue'], self.github.repository)
+        digest = issue_content_hash(issue)
+        self.github.remove_issue(issue.number)
+        if issue.state != 'closed':
+            self.github.add_issue(issue)
+
+        link = self.links_by_issue.get(issue.number)
+        if link:
+            card = (self.cards.item(link['card_id']) or
+                    get_trello_card(self.config, link['card_id']))
+            if card is None:
+                return
+        else:
+            card = self.cards.find(issue.title)
+
+        if card is None:
+            if issue.state == 'closed':
+                return
+            click.echo('creating card for issue "{}"'.format(issue.title))
+            card = create_trello_card(self.trello.board.client, self.list_id,
+                                      issue.title, issue.body or '')
+            copy_issue_to_card(self.trello, issue, card)
+            self.trello.add_card(card)
+        elif card_content_hash(card) != digest:
+            click.echo('updating card for issue "{}"'.format(issue.title))
+            self.trello.remove_card(card.id)
+            copy_issue_to_card(self.trello, issue, card)
+            if not card.closed:
+                self.trello.add_card(card)
+        self.link(issue, card, digest)
+
+    def on_trello(self, payload):
+        action = payload.get('action', {})
+        if action.get('type') not in ('createCard', 'updateCard'):
+            return
+        card_id = action['data']['card']['id']
+        card = get_trello_card(self.config, card_id)
+        self.trello.remove_card(card_id)
+        if card is None:
+            return
+        if not card.closed:
+            self.trello.add_card(card)
+
+        digest = card_content_hash(card)
+        link = self.links_by_card.get(card_id)
+        if link:
+            issue = find_linked_issue(self.github, link)
+            if issue is None:
+                self.unlink_issue(link['issue_number'], card.name, 'deleted')
+                return
+        else:
+            issue = self.issues.find(card.name)
+
+        if issue is None:
+            if card.closed:
+                return
+            click.echo('creating issue for card "{}"'.format(card.name))
+            issue = self.github.repository.create_issue(
+                card.name, card.description or '',
+                labels=[label.name for label in card.labels or []])
+            self.github.add_issue(issue)
+        elif issue_content_hash(issue) != digest:
+            click.echo('updating issue for card "{}"'.format(card.name))
+            copy_card_to_issue(card, issue)
+            self.github.remove_issue(issue.number)
+            if issue.state != 'closed':
+                self.github.add_issue(issue)
+        self.link(issue, card, digest)
+
+    def reconcile(self):
+        click.echo('reconciling {} with {}'.format(self.repo_key, self.trello_board_id))
+        _github_snapshots.pop((self.github_org, self.github_repo), None)
+        _trello_snapshots.pop(self.trello_board_id, None)
+        sync_github_issues_to_trello_cards(
+            self.config, self.github_org, self.github_repo, self.trello_board_id)
+        sync_trello_cards_to_github_issues(
+            self.config, self.trello_board_id, self.github_org, self.github_repo)
+        _github_snapshots.pop((self.github_org, self.github_repo), None)
+        _trello_snapshots.pop(self.trello_board_id, None)
+        self.load()
+
+    def schedule_reconcile(self):
+        self.events.put(('reconcile', None, None))
+        timer = threading.Timer(self.reconcile_interval, self.schedule_reconcile)
+        timer.daemon = True
+        timer.start()
+
+    def run(self):
+        timer = threading.Timer(self.reconcile_interval, self.schedule_reconcile)
+        timer.daemon = True
+        timer.start()
+        while True:
+            kind, event, payload = self.events.get()
+            try:
+                if kind == 'github':
+                    self.on_github(event, payload)
+                elif kind == 'trello':
+                    self.on_trello(payload)
+                elif kind == 'reconcile':
+                    self.reconcile()
+            except Exception as e:
+                click.echo('{} event failed: {}'.format(kind, e), err=True)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    """Accept GitHub and Trello webhooks and queue them for the Watcher.
+
+    GitHub deliveries go to ``/github`` and Trello's to ``/trello``. Trello
+    checks a callback url with a HEAD request before creating a webhook.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        watcher = self.server.watcher
+        config = watcher.config
+
+        if self.path.startswith('/github'):
+            secret = config.github.webhook_secret
+            if secret:
+                expected = 'sha256=' + hmac.new(
+                    secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+                if not hmac.compare_digest(
+                        expected, self.headers.get('X-Hub-Signature-256') or ''):
+                    return self.reply(401)
+            event = self.headers.get('X-GitHub-Event')
+            watcher.events.put(('github', event, json.loads(body.decode('utf-8'))))
+        elif self.path.startswith('/trello'):
+            callback_url = config.trello.webhook_url
+            if callback_url:
+                digest = hmac.new(config.trello.app_secret.encode('utf-8'),
+                                  body + callback_url.encode('utf-8'),
+                                  hashlib.sha1).digest()
+                expected = base64.b64encode(digest).decode('ascii')
+                if not hmac.compare_digest(
+                        expected, self.headers.get('X-Trello-Webhook') or ''):
+                    return self.reply(401)
+            watcher.events.put(('trello', None, json.loads(body.decode('utf-8'))))
+        else:
+            return self.reply(404)
+        self.reply(202)
+
+    def reply(self, status):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def watch(config, github_org, github_repo, trello_board_id,
+          host='127.0.0.1', port=8080, reconcile_interval=900):
+    watcher = Watcher(config, github_org, github_repo, trello_board_id,
+                      reconcile_interval=reconcile_interval)
+    server = HTTPServer((host, port), WebhookHandler)
+    server.watcher = watcher
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    click.echo('watching {} and {} on http://{}:{}/'.format(
+        watcher.repo_key, trello_board_id, host, port))
+    try:
+        watcher.run()
+    finally:
+        server.shutdown()
+
+
+# plan and apply
+
+def github_request(config, method, path, data=None):
+    """Make one GitHub API call with the logged in session."""
+    github = get_github_auth(config.github)
+    session = getattr(github, 'session', None) or github._session
+    if data is not None:
+        data = json.dumps(data)
+    response = session.request(method, GITHUB_API_URL + path, data=data)
+    response.raise_for_status()
+    if response.content:
+        return response.json()
+
+
+def trello_request(config, method, path, data=None):
+    """Make one Trello API call with the logged in client."""
+    trello = get_trello_auth(config.trello)
+    return trello.fetch_json(path, http_method=method, post_args=data or {})
+
+
+def plan_close_existing_github_issues(config, github_org, github_repo):
+    repo = '{}/{}'.format(github_org, github_repo)
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    return [{'service': 'github', 'action': 'close_issue', 'repo': repo,
+             'number': issue.number, 'title': issue.title}
+            for issue in snapshot.issues]
+
+
+def plan_create_github_issues(config, github_org, github_repo,
+                              filename='etc/default_github_issues.csv'):
+    repo = '{}/{}'.format(github_org, github_repo)
+    existing_issues = get_existing_github_issues(config, github_org, github_repo)
+    queued = set()
+    operations = []
+    for title, body, labels in iter_issue_rows(filename):
+        if existing_issues.match(title) is not None or normalize_title(title) in queued:
+            continue
+        queued.add(normalize_title(title))
+        operations.append({'service': 'github', 'action': 'create_issue',
+                           'repo': repo, 'title': title, 'body': body,
+                           'labels': labels})
+    return operations
+
+
+def plan_create_github_labels(config, github_org, github_repo,
+                              filename='etc/default_github_labels.csv',
+                              replace=False):
+    repo = '{}/{}'.format(github_org, github_repo)
+    if replace:
+        existing_labels = TitleIndex()
+    else:
+        existing_labels = get_existing_github_labels(config, github_org, github_repo)
+    queued = set()
+    operations = []
+    for label in iter_csv_rows(filename):
+        name = str(label['name'])
+        color = str(label['color']) or get_random_color()
+        if name in existing_labels or normalize_title(name) in queued:
+            continue
+        queued.add(normalize_title(name))
+        operations.append({'service': 'github', 'action': 'create_label',
+                           'repo': repo, 'name': name, 'color': color})
+    return operations
+
+
+def plan_create_github_milestones(config, github_org, github_repo,
+                                  filename='etc/default_github_milestones.csv'):
+    repo = '{}/{}'.format(github_org, github_repo)
+    existing_milestones = get_existing_github_milestones(
+        config, github_org, github_repo)
+    queued = set()
+    operations = []
+    for milestone in iter_csv_rows(filename):
+        title = str(milestone['title'])
+        if title in existing_milestones or normalize_title(title) in queued:
+            continue
+        queued.add(normalize_title(title))
+        operations.append({'service': 'github', 'action': 'create_milestone',
+                           'repo': repo, 'title': title})
+    return operations
+
+
+def plan_delete_existing_github_labels(config, github_org, github_repo):
+    repo = '{}/{}'.format(github_org, github_repo)
+    snapshot = get_github_snapshot(config, github_org, github_repo)
+    return [{'service': 'github', 'action': 'delete_label', 'repo': repo,
+             'name': label.name}
+            for label in snapshot.labels]
+
+
+def plan_bootstrap(config, github_org, github_repo):
+    operations = plan_delete_existing_github_labels(config, github_org, github_repo)
+    operations += plan_create_github_labels(
+        config, github_org, github_repo, replace=True)
+    operations += plan_create_github_issues(config, github_org, github_repo)
+    operations += plan_create_github_milestones(config, github_org, github_repo)
+    return operations
+
+
+def get_default_list_id(config, trello_board_id):
+    """Return the default list's id without creating it."""
+    existing_lists = get_existing_trello_lists(config, trello_board_id)
+    list_id = existing_lists.get_id(config.trello.default_list)
+    if list_id is None:
+        raise click.ClickException(
+            'Trello list "{}" does not exist yet'.format(config.trello.default_list))
+    return list_id
+
+
+def plan_create_trello_cards(config, trello_board_id,
+                             filename='etc/default_trello_cards.csv'):
+    existing_cards = get_existing_trello_cards(config, trello_board_id)
+    list_id = get_default_list_id(config, trello_board_id)
+    queued = set()
+    operations = []
+    for title, body, labels in iter_issue_rows(filename):
+        if existing_cards.match(title) is not None or normalize_title(title) in queued:
+            continue
+        queued.add(normalize_title(title))
+        operations.append({'service': 'trello', 'action': 'create_card',
+                           'list_id': list_id, 'title': title, 'body': body})
+    return operations
+
+
+def plan_sync_github_issues_to_trello_cards(config, github_org, github_repo,
+                                            trello_board_id):
+    state = get_sync_state(config)
+    repo_key = '{}/{}'.format(github_org, github_repo)
+    since = state.last_run('github:{}->trello:{}'.format(repo_key, trello_board_id))
+    links = dict((link['issue_number'], link)
+                 for link in state.links(repo_key, trello_board_id))
+    existing_cards = get_existing_trello_cards(config, trello_board_id)
+    github_snapshot = get_github_snapshot(config, github_org, github_repo)
+    if since:
+        issues = github_snapshot.iter_issues(state='all', since=since)
+    else:
+        issues = github_snapshot.issues
+    list_id = get_default_list_id(config, trello_board_id)
+    queued = set()
+    operations = []
+    for issue in issues:
+        link = links.get(issue.number)
+        if link and link['issue_updated_at'] == str(issue.updated_at):
+            continue
+        if link:
+            # linked cards are followed even after a rename, as the sync does
+            card = find_linked_card(config, existing_cards, link)
+            if card is None:
+                continue
+        else:
+            card = existing_cards.find(issue.title)
+
+        action = get_sync_action(issue.state == 'closed', issue_content_hash(issue),
+                                 None if card is None else card_content_hash(card),
+                                 link)
+        fields = {'title': issue.title, 'body': issue.body or '',
+                  'labels': issue_labels(issue), 'board_id': trello_board_id}
+        if action == 'create':
+            if normalize_title(issue.title) in queued:
+                continue
+            queued.add(normalize_title(issue.title))
+            operations.append(dict(fields, service='trello', action='create_card',
+                                   list_id=list_id))
+        elif action in ('update', 'conflict'):
+            operations.append(dict(fields, service='trello', action='update_card',
+                                   card_id=card.id,
+                                   closed=issue.state == 'closed'))
+    return operations
+
+
+def plan_sync_trello_cards_to_github_issues(config, trello_board_id,
+                                            github_org, github_repo):
+    repo = '{}/{}'.format(github_org, github_repo)
+    links = dict((link['card_id'], link) for link in
+                 get_sync_state(config).links(repo, trello_board_id))
+    github_snapshot = get_github_snapshot(config, github_org, github_repo)
+    existing_issues = github_snapshot.issue_index
+    board = get_trello_snapshot(config, trello_board_id).board
+    queued = set()
+    operations = []
+    for card in load_trello_cards(board.client, trello_board_id, filter='all'):
+        link = links.get(card.id)
+        updated_at = get_card_updated_at(card)
+        if link and updated_at and link['card_updated_at'] == updated_at:
+            continue
+        if link:
+            # linked issues are followed even after a rename, as the sync does
+            issue = find_linked_issue(github_snapshot, link)
+            if issue is None:
+                click.echo('issue for card "{}" was deleted'.format(card.name))
+                continue
+        else:
+            issue = existing_issues.find(card.name)
+
+        action = get_sync_action(card.closed, card_content_hash(card),
+                                 None if issue is None else issue_content_hash(issue),
+                                 link)
+        fields = {'service': 'github', 'repo': repo, 'title': card.name,
+                  'body': card.description or '',
+                  'labels': [label.name for label in card.labels or []]}
+        if action == 'create':
+            if normalize_title(card.name) in queued:
+                continue
+            queued.add(normalize_title(card.name))
+            operations.append(dict(fields, action='create_issue'))
+        elif action in ('update', 'conflict'):
+            operations.append(dict(fields, action='edit_issue', number=issue.number,
+                                   state='closed' if card.closed else 'open'))
+    return operations
+
+
+def get_trello_label_ids(config, trello_board_id, names):
+    """Return the ids of a board's labels by name, creating missing ones.
+
+    The board's labels are listed once per run, and each missing label is
+    created once however many planned cards ask for it.
+    """
+    with _trello_label_ids_lock:
+        label_ids = _trello_label_ids.get(trello_board_id)
+        if label_ids is None:
+            trello = get_trello_auth(config.trello)
+            labels = trello.fetch_json('/boards/{}/labels'.format(trello_board_id),
+                                       query_params={'limit': 1000})
+            label_ids = _trello_label_ids[trello_board_id] = dict(
+                (normalize_title(label['name']), label['id'])
+                for label in labels if label.get('name'))
+        ids = []
+        for name in names:
+            key = normalize_title(name)
+            if key not in label_ids:
+                label = trello_request(config, 'POST', '/labels', {
+                    'name': name, 'idBoard': trello_board_id, 'color': None})
+                label_ids[key] = label['id']
+            ids.append(label_ids[key])
+        return ids
+
+
+def apply_operation(config, operation):
+    """Run one planned write.
+
+    The only reads are of the labels on a board whose cards are given
+    labels by name, once per board.
+    """
+    action = operation['action']
+    if operation['service'] == 'github':
+        path = '/repos/{}'.format(operation['repo'])
+        if action == 'close_issue':
+            return github_request(config, 'PATCH', '{}/issues/{}'.format(
+                path, operation['number']), {'state': 'closed'})
+        if action == 'create_issue':
+            return github_request(config, 'POST', path + '/issues', {
+                'title': operation['title'],
+                'body': operation['body'],
+                'labels': operation['labels']})
+        if action == 'edit_issue':
+            data = {'title': operation['title'], 'body': operation['body']}
+            for key in ('state', 'labels'):
+                if key in operation:
+                    data[key] = operation[key]
+            return github_request(config, 'PATCH', '{}/issues/{}'.format(
+                path, operation['number']), data)
+        if action == 'create_label':
+            return github_request(config, 'POST', path + '/labels', {
+                'name': operation['name'],
+                'color': operation['color']})
+        if action == 'delete_label':
+            return github_request(config, 'DELETE', '{}/labels/{}'.format(
+                path, quote(operation['name'].encode('utf-8'), safe='')))
+        if action == 'create_milestone':
+            return github_request(config, 'POST', path + '/milestones', {
+                'title': operation['title']})
+    elif operation['service'] == 'trello':
+        data = {'name': operation['title'], 'desc': operation['body']}
+        if 'labels' in operation:
+            data['idLabels'] = ','.join(get_trello_label_ids(
+                config, operation['board_id'], operation['labels']))
+        if action == 'create_card':
+            data['idList'] = operation['list_id']
+            return trello_request(config, 'POST', '/cards', data)
+        if action == 'update_card':
+            if 'closed' in operation:
+                data['closed'] = operation['closed']
+            return trello_request(config, 'PUT', '/cards/{}'.format(
+                operation['card_id']), data)
+    raise ValueError('unknown operation {} {}'.format(
+        operation['service'], action))
+
+
+def describe_operation(operation):
+    return operation.get('title') or operation.get('name') or operation.get('number')
+
+
+def write_changeset(operations, filename):
+    changeset = {
+        'version': 1,
+        'created_at': utcnow(),
+        'operations': operations,
+    }
+    with open(filename, 'w') as f:
+        json.dump(changeset, f, indent=2, sort_keys=True)
+
+
+def read_changeset(filename):
+    with open(filename) as f:
+        changeset = json.load(f)
+    return changeset['operations']
+
+
+def get_changeset_digest(operations):
+    """Return a hash of a plan's operations.
+
+    The apply journal is keyed by it, so --resume never skips operations
+    of a different plan written to the same file.
+    """
+    data = json.dumps(operations, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def summarize_changeset(operations):
+    counts = {}
+    for operation in operations:
+        key = (operation['service'], operation['action'])
+        counts[key] = counts.get(key, 0) + 1
+    for (service, action), count in sorted(counts.items()):
+        click.echo('{} {}: {}'.format(service, action, count))
+
+
+def apply_changeset(config, operations, step=None):
+    """Run planned operations in order, batching runs of the same action.
+
+    Consecutive operations with the same service and action run together
+    through execute(); a batch only starts once the previous one has
+    finished, so deletes planned before creates still happen first.
+    Operations are journaled by their position in the plan.
+    """
+    batches = []
+    for index, operation in enumerate(operations):
+        if step is not None and step.is_done(index):
+            continue
+        key = (operation['service'], operation['action'])
+        if batches and batches[-1][0] == key:
+            batches[-1][1].append((index, operation))
+        else:
+            batches.append((key, [(index, operation)]))
+
+    failed = 0
+    for (service, action), batch in batches:
+        tally = Tally('applied', action, total=len(batch))
+
+        def run(item):
+            return apply_operation(config, item[1])
+
+        for (index, operation), result, error in execute(config, service, run, batch):
+            if error is None and step is not None:
+                step.done(index)
+            tally.record(describe_operation(operation), error)
+        tally.echo_summary()
+        failed += tally.failed
+    if step is not None and not failed:
+        step.finish()
+    return failed
 
 
 # cli methods we are exposing to be used via terminal
@@ -505,9 +3756,39 @@ def test_buffer(config):
 @click_config.wrap(module=config, sections=('github', 'trello'))
 @click.option('--version', is_flag=True, callback=print_version,
               expose_value=False, is_eager=True)
-def cli():
+@click.option('--concurrency', type=int, default=TROLLEY_CONCURRENCY,
+              help='Number of API calls bulk commands run at once.')
+@click.option('--graphql/--no-graphql', default=GITHUB_GRAPHQL,
+              help='Load GitHub issues, labels and milestones over GraphQL.')
+@click.option('--profile', is_flag=True,
+              help='Print API call and phase timings when the command ends.')
+@click.option('--profile-output', type=click.Path(),
+              help='Write the --profile report to this file as JSON.')
+@click.option('--resume', is_flag=True,
+              help='Skip work an interrupted run of the command finished.')
+@click.option('--engine', type=click.Choice(['threads', 'async']),
+              default=TROLLEY_ENGINE,
+              help='Run the sync commands on threads or on asyncio.')
+@click.option('--fuzzy-threshold', type=click.FloatRange(0, 1),
+              default=TROLLEY_FUZZY_THRESHOLD,
+              help='Treat titles this similar as the same; 0 turns it off.')
+def cli(concurrency, graphql, profile, profile_output, resume, engine, fuzzy_threshold):
+    global _profiler
+
     assert config.buffer
-    pass
+    config.concurrency = concurrency
+    config.github.graphql = graphql
+    config.resume = resume
+    config.engine = engine
+    config.fuzzy_threshold = fuzzy_threshold
+
+    if profile or profile_output:
+        _profiler = Profiler()
+        ctx = click.get_current_context()
+        if profile_output:
+            ctx.call_on_close(lambda: _profiler.write(profile_output))
+        else:
+            ctx.call_on_close(_profiler.echo)
 
 
 @cli.command('bootstrap')
@@ -656,13 +3937,57 @@ def cli_delete_existing_github_milestones(force, github_org, github_repo):
         click.echo('Action aborted')
 
 
+@cli.command('export_github_issues')
+@click.option('--filename', default='-', help='file to write, or - for stdout')
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--fields', help='comma separated fields, default title,body,labels')
+@click.option('--state', type=click.Choice(['open', 'closed', 'all']), default='open')
+@click.option('--gzip', 'compress', is_flag=True, help='gzip the output')
+@click.option('--github-org', type=str)
+@click.option('--github-repo', type=str)
+def cli_export_github_issues(filename, format, fields, state, compress, github_org,
+                             github_repo):
+    """Export GitHub issues to a CSV or JSONL file."""
+    export_github_issues(
+        config,
+        github_org or config.github.org,
+        github_repo or config.github.repo,
+        filename,
+        format=format,
+        fields=fields,
+        state=state,
+        compress=compress)
+
+
+@cli.command('export_trello_cards')
+@click.option('--filename', default='-', help='file to write, or - for stdout')
+@click.option('--format', 'format', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--fields', help='comma separated fields, default title,body,labels')
+@click.option('--state', type=click.Choice(['open', 'closed', 'all']), default='open')
+@click.option('--gzip', 'compress', is_flag=True, help='gzip the output')
+@click.option('--trello-board', type=str)
+def cli_export_trello_cards(filename, format, fields, state, compress, trello_board):
+    """Export Trello cards to a CSV or JSONL file."""
+    export_trello_cards(
+        config,
+        trello_board or config.trello.board_id,
+        filename,
+        format=format,
+        fields=fields,
+        state=state,
+        compress=compress)
+
+
 @cli.command('sync_github_issues_to_trello_cards')
 @click.option('--github-org', type=str)
 @click.option('--github-repo', type=str)
 @click.option('--trello-board', type=str)
 def cli_sync_github_issues_to_trello_cards(github_org, github_repo, trello_board):
     """Convert your GitHub issues to Trello cards."""
-    sync_github_issues_to_trello_cards(
+    sync = sync_github_issues_to_trello_cards
+    if config.engine == 'async':
+        sync = get_async_engine().sync_github_issues_to_trello_cards
+    sync(
         config,
         github_org or config.github.org,
         github_repo or config.github.repo,
@@ -675,13 +4000,54 @@ def cli_sync_github_issues_to_trello_cards(github_org, github_repo, trello_board
 @click.option('--github-repo', type=str)
 def cli_sync_trello_cards_to_github_issues(trello_board, github_org, github_repo):
     """Convert your Trello cards to GitHub issues."""
-    sync_trello_cards_to_github_issues(
+    sync = sync_trello_cards_to_github_issues
+    if config.engine == 'async':
+        sync = get_async_engine().sync_trello_cards_to_github_issues
+    sync(
         config,
         trello_board or config.trello.board_id,
         github_org or config.github.org,
         github_repo or config.github.repo)
 
 
+@cli.command('sync_all')
+@click.option('--projects', 'filename', type=click.Path(exists=True),
+              help='CSV of github_org, github_repo and trello_board_id.')
+@click.option('--direction', default='both',
+              type=click.Choice(['both', 'github', 'trello']),
+              help='github copies issues to cards, trello cards to issues.')
+@click.option('--workers', type=int,
+              help='Pairs to sync at once (defaults to --concurrency).')
+def cli_sync_all(filename, direction, workers):
+    """Sync every configured GitHub repo and Trello board pair."""
+    projects = get_projects(config, filename)
+    if not projects:
+        raise click.ClickException('no projects are configured')
+    tally = sync_all(config, projects, direction=direction, workers=workers)
+    if tally.failed:
+        raise click.ClickException('{} projects failed'.format(tally.failed))
+
+
+@cli.command('watch')
+@click.option('--github-org', type=str)
+@click.option('--github-repo', type=str)
+@click.option('--trello-board', type=str)
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', default=8080, type=int)
+@click.option('--reconcile-interval', default=900, type=int,
+              help='Seconds between full syncs run as a fallback.')
+def cli_watch(github_org, github_repo, trello_board, host, port, reconcile_interval):
+    """Keep GitHub and Trello in step from their webhooks."""
+    watch(
+        config,
+        github_org or config.github.org,
+        github_repo or config.github.repo,
+        trello_board or config.trello.board_id,
+        host=host,
+        port=port,
+        reconcile_interval=reconcile_interval)
+
+
 @cli.command('list_trello_boards')
 def cli_list_trello_boards():
     """List your Trello boards."""
@@ -706,6 +4072,113 @@ def cli_list_trello_organizations():
     list_trello_organizations(config)
 
 
+@cli.command('plan')
+@click.argument('command', type=click.Choice([
+    'bootstrap',
+    'close_existing_github_issues',
+    'create_github_issues',
+    'create_github_labels',
+    'create_github_milestones',
+    'create_trello_cards',
+    'delete_existing_github_labels',
+    'sync_github_issues_to_trello_cards',
+    'sync_trello_cards_to_github_issues',
+]))
+@click.option('--output', default='trolley-plan.json')
+@click.option('--filename', type=str)
+@click.option('--github-org', type=str)
+@click.option('--github-repo', type=str)
+@click.option('--trello-board', type=str)
+def cli_plan(command, output, filename, github_org, github_repo, trello_board):
+    """Write the changes a command would make to a plan file."""
+    github_org = github_org or config.github.org
+    github_repo = github_repo or config.github.repo
+    trello_board = trello_board or config.trello.board_id
+    options = {'filename': filename} if filename else {}
+
+    if command == 'bootstrap':
+        operations = plan_bootstrap(config, github_org, github_repo)
+    elif command == 'create_trello_cards':
+        operations = plan_create_trello_cards(config, trello_board, **options)
+    elif command == 'sync_github_issues_to_trello_cards':
+        operations = plan_sync_github_issues_to_trello_cards(
+            config, github_org, github_repo, trello_board)
+    elif command == 'sync_trello_cards_to_github_issues':
+        operations = plan_sync_trello_cards_to_github_issues(
+            config, trello_board, github_org, github_repo)
+    else:
+        planner = {
+            'close_existing_github_issues': plan_close_existing_github_issues,
+            'create_github_issues': plan_create_github_issues,
+            'create_github_labels': plan_create_github_labels,
+            'create_github_milestones': plan_create_github_milestones,
+            'delete_existing_github_labels': plan_delete_existing_github_labels,
+        }[command]
+        operations = planner(config, github_org, github_repo, **options)
+
+    write_changeset(operations, output)
+    summarize_changeset(operations)
+    click.echo('wrote {} operations to {}'.format(len(operations), output))
+
+
+@cli.command('apply')
+@click.argument('filename', default='trolley-plan.json')
+@click.option('--force/--no-force', default=False)
+def cli_apply(filename, force):
+    """Apply a plan file written by the plan command."""
+    operations = read_changeset(filename)
+    summarize_changeset(operations)
+    message = 'Do you really want to apply these {} changes?'.format(len(operations))
+    if force or click.confirm(message):
+        step = get_journal(config).step('apply', filename,
+                                        get_changeset_digest(operations))
+        if step.skip_if_finished():
+            return
+        failed = apply_changeset(config, operations, step=step)
+        if failed:
+            raise click.ClickException('{} operations failed'.format(failed))
+    else:
+        click.echo('Action aborted')
+
+
+@cli.command('near_matches')
+@click.option('--github-org', type=str)
+@click.option('--github-repo', type=str)
+@click.option('--trello-board', type=str)
+def cli_near_matches(github_org, github_repo, trello_board):
+    """List issues whose titles nearly match a Trello card's."""
+    report_near_matches(
+        config,
+        github_org or config.github.org,
+        github_repo or config.github.repo,
+        trello_board or config.trello.board_id)
+
+
+@cli.command('rate_limits')
+def cli_rate_limits():
+    """Show how much of each API's rate limit is left."""
+
+    if config.github.username:
+        get_github_auth(config.github).rate_limit()
+    for service in sorted(RATE_LIMITS):
+        click.echo(get_governor(service).status())
+
+
+@cli.command('schedule_buffer_updates')
+@click.option('--filename', required=True, help='CSV with text, profile and scheduled_at')
+@click.option('--service', type=str, help='only use profiles for this service')
+def cli_schedule_buffer_updates(filename, service):
+    """Queue Buffer updates from a CSV file."""
+    schedule_buffer_updates(config, filename, service)
+
+
+@cli.command('list_buffer_updates')
+@click.option('--service', type=str, help='only list profiles for this service')
+def cli_list_buffer_updates(service):
+    """List pending Buffer updates for every profile."""
+    list_buffer_updates(config, service)
+
+
 @cli.command('test_buffer')
 def cli_test_buffer():
     """Convert your Trello cards to GitHub issues."""
@@ -713,7 +4186,7 @@ def cli_test_buffer():
     try:
         test_buffer(config)
     except Exception as e:
-        print e
+        click.echo(e)
 
 
 if __name__ == '__main__':
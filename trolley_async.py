@@ -0,0 +1,496 @@
+"""
+asyncio engine for trolley's sync commands, used with ``--engine async``.
+
+It needs Python 3.7+ and aiohttp (``pip install trolley[async]``). It
+makes the same decisions as the sync functions in trolley, using the same
+sync state, content hashes, title matching, and rate governors. The
+difference is that it talks to the GitHub and Trello REST APIs directly
+from one event loop. Both services are paged at once, and every read and
+write an item needs is in flight together, bounded per service by
+``config.max_in_flight``.
+"""
+
+import asyncio
+import collections
+import json
+import time
+
+import aiohttp
+import click
+
+import trolley
+
+# the shapes trolley's RateGovernor and Profiler read from requests objects
+Request = collections.namedtuple('Request', 'method url body')
+Response = collections.namedtuple('Response', 'status_code headers content')
+
+# errors raised before a request reached the server; a reset or a broken
+# pipe may come after the server acted on it, so those are never retried.
+# aiohttp only tells connect timeouts apart from read timeouts since 3.10
+CONNECT_ERRORS = (aiohttp.ClientConnectorError,
+                  getattr(aiohttp, 'ConnectionTimeoutError', aiohttp.ClientConnectorError))
+
+
+class APIError(click.ClickException):
+    """A call the API answered with an error status."""
+
+    def __init__(self, message, status_code):
+        click.ClickException.__init__(self, message)
+        self.status_code = status_code
+
+
+class Client(object):
+    """A rate-governed aiohttp client for one service's REST API."""
+
+    def __init__(self, session, service, base_url, limit, params=None,
+                 auth=None, rate_limit_retries=3, connect_retries=3):
+        self.session = session
+        self.service = service
+        self.api_url = trolley.API_URLS[service]
+        self.base_url = base_url.rstrip('/')
+        self.params = params or {}
+        self.auth = auth
+        self.rate_limit_retries = rate_limit_retries
+        self.connect_retries = connect_retries
+        self.governor = trolley.get_governor(service)
+        self.semaphore = asyncio.Semaphore(max(limit, 1))
+
+    def url(self, path):
+        if path.startswith(self.api_url):
+            path = path[len(self.api_url):]
+        if path.startswith('http'):
+            return path
+        return self.base_url + path
+
+    async def request(self, method, path, params=None, data=None):
+        """Make one call and return (response, parsed body)."""
+        url = self.url(path)
+        params = dict(self.params, **(params or {}))
+        body = json.dumps(data).encode('utf-8') if data is not None else None
+        headers = {'Content-Type': 'application/json'} if body else {}
+        loop = asyncio.get_running_loop()
+
+        async with self.semaphore:
+            waited = 0.0
+            for attempt in range(self.rate_limit_retries + 1):
+                # the governor sleeps to pace calls, so it runs off the loop
+                started = time.time()
+                await loop.run_in_executor(None, self.governor.acquire)
+                waited += time.time() - started
+
+                started = time.time()
+                result, links = await self.send(method, url, params, body, headers)
+                seconds = time.time() - started
+                self.governor.update(result)
+                if trolley._profiler is not None:
+                    trolley._profiler.record(self.service, Request(method, url, body),
+                                             result, seconds, attempt, waited)
+                if not self.governor.is_limited(result) or attempt == self.rate_limit_retries:
+                    break
+
+        if result.status_code >= 400:
+            raise APIError('{} {} failed with {}: {}'.format(
+                method, url, result.status_code,
+                result.content[:200].decode('utf-8', 'replace')), result.status_code)
+        return links, json.loads(result.content.decode('utf-8')) if result.content else None
+
+    async def send(self, method, url, params, body, headers):
+        """Send one request, retrying if it never reached the server.
+
+        Like the threaded engine's ``Retry(connect=3)``, only failures to
+        connect are retried, never a lost response, so a POST the server
+        may have acted on is not sent twice.
+        """
+        for attempt in range(self.connect_retries + 1):
+            try:
+                async with self.session.request(method, url, params=params, data=body,
+                                                headers=headers, auth=self.auth) as response:
+                    content = await response.read()
+                    return Response(response.status, response.headers, content), response.links
+            except CONNECT_ERRORS:
+                if attempt == self.connect_retries:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def get(self, path, params=None):
+        _, data = await self.request('GET', path, params)
+        return data
+
+    async def pages(self, path, params=None):
+        """Read every page of a GitHub listing.
+
+        The first page's ``last`` link says how many pages there are, so
+        the rest are all requested at once.
+        """
+        params = dict(params or {}, per_page=100)
+        links, first = await self.request('GET', path, params)
+        last = links.get('last')
+        if last is None:
+            items = list(first)
+            url = links.get('next', {}).get('url')
+            while url:
+                links, page = await self.request('GET', str(url))
+                items.extend(page)
+                url = links.get('next', {}).get('url')
+            return items
+
+        count = int(last['url'].query.get('page', 1))
+        rest = await gather(*[
+            self.get(path, dict(params, page=page)) for page in range(2, count + 1)])
+        items = list(first)
+        for page in rest:
+            items.extend(page)
+        return items
+
+
+async def gather(*coroutines):
+    """Run coroutines together, raising the first error once all are done.
+
+    Unlike a bare ``asyncio.gather`` nothing is left running against a
+    session that is about to close.
+    """
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def github_client(config, session):
+    github = config.github
+    return Client(session, 'github', github.base_url or trolley.API_URLS['github'],
+                  config.max_in_flight,
+                  auth=aiohttp.BasicAuth(github.username, github.password))
+
+
+def trello_client(config, session):
+    trello = config.trello
+    base_url = trello.base_url or trolley.API_URLS['trello']
+    return Client(session, 'trello', base_url.rstrip('/') + '/1', config.max_in_flight,
+                  params={'key': trello.app_key, 'token': trello.auth_token})
+
+
+def issue_record(data):
+    fields = trolley.issue_to_dict(data)
+    return trolley.make_record(trolley.IssueRecord, None, fields.pop('url'), **fields)
+
+
+def card_record(data):
+    return trolley.card_from_json(None, data)
+
+
+CARD_FIELDS = ','.join(trolley.TRELLO_CARD_FIELDS)
+
+
+class TrelloBoard(object):
+    """A board's cards, default list, and labels for one sync run.
+
+    Labels an issue needs but the board lacks are created once, however
+    many cards ask for them at the same time.
+    """
+
+    def __init__(self, client, board_id, cards, lists, labels, fuzzy_threshold=0):
+        self.client = client
+        self.board_id = board_id
+        self.cards = trolley.TitleIndex(fuzzy_threshold)
+        for card in cards:
+            self.cards.add(card.name, card.id, card)
+        self.lists = lists
+        self.labels = dict((trolley.normalize_title(label['name']), label['id'])
+                           for label in labels if label.get('name'))
+        self._creating = {}
+
+    async def default_list_id(self, name):
+        for item in self.lists:
+            if item['name'] == name:
+                return item['id']
+        _, item = await self.client.request('POST', '/lists', data={
+            'name': name, 'idBoard': self.board_id})
+        self.lists.append(item)
+        return item['id']
+
+    async def label_id(self, name):
+        key = trolley.normalize_title(name)
+        if key in self.labels:
+            return self.labels[key]
+        if key not in self._creating:
+            self._creating[key] = asyncio.ensure_future(self.client.request(
+                'POST', '/labels', data={'name': name, 'idBoard': self.board_id,
+                                         'color': None}))
+        _, label = await self._creating[key]
+        self.labels[key] = label['id']
+        return label['id']
+
+    async def card_fields(self, issue):
+        label_ids = await asyncio.gather(*[
+            self.label_id(name) for name in trolley.issue_labels(issue)])
+        return {
+            'name': issue.title,
+            'desc': issue.body or '',
+            'closed': issue.state == 'closed',
+            'idLabels': ','.join(label_ids),
+        }
+
+
+async def load_board(trello, board_id, card_filter='open', fuzzy_threshold=0):
+    cards, lists, labels = await asyncio.gather(
+        trello.get('/boards/{}/cards'.format(board_id),
+                   {'filter': card_filter, 'fields': CARD_FIELDS}),
+        trello.get('/boards/{}/lists'.format(board_id), {'filter': 'all'}),
+        trello.get('/boards/{}/labels'.format(board_id), {'limit': 1000}))
+    return TrelloBoard(trello, board_id, [card_record(card) for card in cards],
+                       lists, labels, fuzzy_threshold)
+
+
+async def github_to_trello(config, github, trello, github_org, github_repo,
+                           trello_board_id):
+    state = trolley.get_sync_state(config)
+    repo_key = '{}/{}'.format(github_org, github_repo)
+    scope = 'github:{}->trello:{}'.format(repo_key, trello_board_id)
+    started_at = trolley.utcnow()
+    since = state.last_run(scope)
+    links = dict((link['issue_number'], link)
+                 for link in state.links(repo_key, trello_board_id))
+
+    # only issues changed since the last run need to be looked at, and
+    # closed ones are included so closing an issue archives its card
+    params = {'state': 'all', 'since': since} if since else {'state': 'open'}
+    issues, board = await asyncio.gather(
+        github.pages('/repos/{}/issues'.format(repo_key), params),
+        load_board(trello, trello_board_id, fuzzy_threshold=config.fuzzy_threshold))
+    list_id = await board.default_list_id(config.trello.default_list)
+    created = {}
+
+    async def create_card(issue):
+        fields = await board.card_fields(issue)
+        fields['idList'] = list_id
+        _, data = await trello.request('POST', '/cards', data=fields)
+        card = card_record(data)
+        board.cards.add(card.name, card.id, card)
+        return card
+
+    async def sync_issue(issue):
+        title = issue.title
+        updated_at = str(issue.updated_at)
+        digest = trolley.issue_content_hash(issue)
+        link = links.get(issue.number)
+        key = trolley.normalize_title(title)
+
+        if link and link['issue_updated_at'] == updated_at:
+            return
+
+        if link:
+            card = board.cards.item(link['card_id'])
+            if card is None:
+                try:
+                    card = card_record(await trello.get(
+                        '/cards/{}'.format(link['card_id']), {'fields': CARD_FIELDS}))
+                except APIError as e:
+                    if e.status_code != 404:
+                        raise
+                    click.echo('card for issue "{}" was deleted'.format(title))
+                    return
+        else:
+            card = board.cards.find(title)
+            if card is None and key in created:
+                # another issue with this title is creating its card
+                card = await created[key]
+
+        action = trolley.get_sync_action(
+            issue.state == 'closed', digest,
+            None if card is None else trolley.card_content_hash(card), link)
+        if action == 'skip':
+            return
+        if action == 'create':
+            click.echo('creating issue "{}"'.format(title))
+            created[key] = asyncio.ensure_future(create_card(issue))
+            card = await created[key]
+        elif action == 'unchanged':
+            click.echo('issue "{}" is unchanged'.format(title))
+        elif action == 'target_changed':
+            click.echo('card for issue "{}" changed on Trello'.format(title))
+            return
+        else:
+            if action == 'conflict':
+                click.echo('issue "{}" changed on both sides, '
+                           'keeping GitHub\'s'.format(title))
+            click.echo('updating issue "{}"'.format(title))
+            fields = await board.card_fields(issue)
+            _, data = await trello.request(
+                'PUT', '/cards/{}'.format(card.id), data=fields)
+            card = card_record(data)
+
+        state.link(repo_key, issue.number, trello_board_id, card.id,
+                   issue_updated_at=updated_at,
+                   card_updated_at=trolley.get_card_updated_at(card),
+                   content_hash=digest)
+
+    await gather(*[sync_issue(issue_record(data)) for data in issues])
+    state.record_run(scope, started_at)
+
+
+async def trello_to_github(config, github, trello, trello_board_id, github_org,
+                           github_repo):
+    state = trolley.get_sync_state(config)
+    repo_key = '{}/{}'.format(github_org, github_repo)
+    links = dict((link['card_id'], link)
+                 for link in state.links(repo_key, trello_board_id))
+
+    cards, issues = await asyncio.gather(
+        trello.get('/boards/{}/cards'.format(trello_board_id),
+                   {'filter': 'all', 'fields': CARD_FIELDS}),
+        github.pages('/repos/{}/issues'.format(repo_key), {'state': 'open'}))
+    existing_issues = trolley.TitleIndex(config.fuzzy_threshold)
+    for data in issues:
+        issue = issue_record(data)
+        existing_issues.add(issue.title, issue.number, issue)
+    created = {}
+
+    async def create_issue(card):
+        _, data = await github.request(
+            'POST', '/repos/{}/issues'.format(repo_key), data={
+                'title': card.name,
+                'body': card.description or '',
+                'labels': [label.name for label in card.labels or []],
+            })
+        issue = issue_record(data)
+        existing_issues.add(issue.title, issue.number, issue)
+        return issue
+
+    async def sync_card(card):
+        name = card.name
+        updated_at = trolley.get_card_updated_at(card)
+        digest = trolley.card_content_hash(card)
+        link = links.get(card.id)
+        key = trolley.normalize_title(name)
+
+        if link and updated_at and link['card_updated_at'] == updated_at:
+            return
+
+        if link:
+            issue = existing_issues.item(link['issue_number'])
+            if issue is None:
+                try:
+                    issue = issue_record(await github.get('/repos/{}/issues/{}'.format(
+                        repo_key, link['issue_number'])))
+                except APIError as e:
+                    # deleted issues answer 410, transferred ones 404
+                    if e.status_code not in (404, 410):
+                        raise
+                    click.echo('issue for card "{}" was deleted'.format(name))
+                    state.forget_issue(repo_key, link['issue_number'])
+                    return
+        else:
+            issue = existing_issues.find(name)
+            if issue is None and key in created:
+                # another card with this name is creating its issue
+                issue = await created[key]
+
+        action = trolley.get_sync_action(
+            card.closed, digest,
+            None if issue is None else trolley.issue_content_hash(issue), link)
+        if action == 'skip':
+            return
+        if action == 'create':
+            click.echo('creating card "{}"'.format(name))
+            created[key] = asyncio.ensure_future(create_issue(card))
+            issue = await created[key]
+        elif action == 'unchanged':
+            click.echo('card "{}" is unchanged'.format(name))
+        elif action == 'target_changed':
+            click.echo('issue for card "{}" changed on GitHub'.format(name))
+            return
+        else:
+            if action == 'conflict':
+                click.echo('card "{}" changed on both sides, '
+                           'keeping Trello\'s'.format(name))
+            click.echo('updating card "{}"'.format(name))
+            _, data = await github.request(
+                'PATCH', '/repos/{}/issues/{}'.format(repo_key, issue.number), data={
+                    'title': card.name,
+                    'body': card.description or '',
+                    'state': 'closed' if card.closed else 'open',
+                    'labels': [label.name for label in card.labels or []],
+                })
+            issue = issue_record(data)
+
+        state.link(repo_key, issue.number, trello_board_id, card.id,
+                   issue_updated_at=str(issue.updated_at),
+                   card_updated_at=updated_at,
+                   content_hash=digest)
+
+    click.echo('creating {} cards'.format(len(cards)))
+    await gather(*[sync_card(card_record(data)) for data in cards])
+
+
+async def sync_project(config, github, trello, project, direction):
+    github_org, github_repo, trello_board_id = project
+    if direction in ('both', 'github'):
+        await github_to_trello(config, github, trello, github_org, github_repo,
+                               trello_board_id)
+    if direction in ('both', 'trello'):
+        await trello_to_github(config, github, trello, trello_board_id, github_org,
+                               github_repo)
+
+
+async def sync_projects(config, projects, direction):
+    connector = aiohttp.TCPConnector(limit=config.max_in_flight * 2)
+    timeout = aiohttp.ClientTimeout(sock_connect=trolley.HTTP_TIMEOUT[0],
+                                    sock_read=trolley.HTTP_TIMEOUT[1])
+    headers = {'Accept-Encoding': 'gzip, deflate'}
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     headers=headers) as session:
+        github = github_client(config, session)
+        trello = trello_client(config, session)
+
+        async def run(group):
+            # pairs sharing a repo or a board would race on its listing
+            outcomes = []
+            for project in group:
+                started = time.time()
+                try:
+                    await sync_project(config, github, trello, project, direction)
+                    error = None
+                except Exception as e:
+                    error = e
+                outcomes.append((project, time.time() - started, error))
+            return outcomes
+
+        groups = await asyncio.gather(*[
+            run(group) for group in trolley.group_projects(projects)])
+        return [outcome for outcomes in groups for outcome in outcomes]
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def sync_all(config, projects, direction='both'):
+    """Sync every pair on one event loop and return the Tally of pairs."""
+    tally = trolley.Tally('synced', 'project')
+    for (github_org, github_repo, trello_board_id), seconds, error in run(
+            sync_projects(config, projects, direction)):
+        tally.record('{}/{} <-> {} in {:.1f}s'.format(
+            github_org, github_repo, trello_board_id, seconds), error)
+    tally.echo_summary()
+    return tally
+
+
+def sync_one(config, project, direction):
+    for project, seconds, error in run(sync_projects(config, [project], direction)):
+        if error is not None:
+            raise error
+
+
+def sync_github_issues_to_trello_cards(config, github_org, github_repo,
+                                       trello_board_id):
+    sync_one(config, (github_org, github_repo, trello_board_id), 'github')
+
+
+def sync_trello_cards_to_github_issues(config, trello_board_id, github_org,
+                                       github_repo):
+    sync_one(config, (github_org, github_repo, trello_board_id), 'trello')